@@ -0,0 +1,235 @@
+"""Постоянный кеш ответов OpenAI API с адресацией по содержимому запроса"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_ENABLED = os.getenv('BRAND_ANALYZER_CACHE', '1') != '0'
+DEFAULT_CACHE_PATH = os.getenv(
+    'BRAND_ANALYZER_CACHE_PATH',
+    os.path.join('cache', 'api_responses.sqlite')
+)
+DEFAULT_CACHE_MAX_MB = float(os.getenv('BRAND_ANALYZER_CACHE_MAX_MB', '512'))
+
+# Параметры запроса, которые не влияют на ответ модели и не входят в ключ
+NON_SEMANTIC_PARAMS = ('timeout', 'extra_headers', 'stream')
+# Форматы ответа, при которых в кеш попадает только разбираемый JSON
+JSON_RESPONSE_FORMATS = ('json_object', 'json_schema')
+
+
+def make_cache_key(request_params):
+    """SHA-256 от канонического JSON запроса.
+
+    В ключ входят модель, все сообщения (текст промптов и base64 изображений,
+    то есть байты картинки) и параметры генерации.
+    """
+    params = {k: v for k, v in request_params.items() if k not in NON_SEMANTIC_PARAMS}
+    canonical = json.dumps(params, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def is_cacheable(response, request_params):
+    """Можно ли сохранить ответ: все варианты завершены штатно (finish_reason 'stop'),
+    а при запросе JSON (response_format) их содержимое разбирается как JSON.
+
+    Обрезанный или неразборчивый ответ в кеш не попадает, иначе повтор
+    запроса получал бы из кеша тот же негодный ответ и в этом, и в следующих запусках.
+    """
+    if not response.choices:
+        return False
+    response_format = request_params.get('response_format') or {}
+    wants_json = response_format.get('type') in JSON_RESPONSE_FORMATS
+    for choice in response.choices:
+        if choice.finish_reason != 'stop':
+            return False
+        if wants_json:
+            try:
+                json.loads(choice.message.content or '')
+            except ValueError:
+                return False
+    return True
+
+
+def load_cached(cache, key, request_params):
+    """Ответ ChatCompletion из кеша или None. Негодная запись (сохраненная до проверки) удаляется."""
+    from openai.types.chat import ChatCompletion
+
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    response = ChatCompletion.model_validate_json(cached)
+    if is_cacheable(response, request_params):
+        return response
+    cache.discard(key)
+    return None
+
+
+def store_response(cache, key, response, request_params):
+    """Сохраняет ответ, если он годится для повторного использования"""
+    if not is_cacheable(response, request_params):
+        return False
+    cache.put(key, response.model_dump_json())
+    return True
+
+
+def open_default_cache():
+    """Открывает кеш по настройкам окружения (None, если кеш выключен)"""
+    if not CACHE_ENABLED:
+        return None
+    return ResponseCache()
+
+
+class ResponseCache:
+    """Кеш ответов в SQLite с вытеснением по размеру (LRU).
+
+    В режиме multiprocess база открывается в WAL-режиме с ожиданием блокировок,
+    а запись и вытеснение идут в транзакциях BEGIN IMMEDIATE, поэтому один
+    каталог кеша могут безопасно использовать несколько процессов.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size_mb=DEFAULT_CACHE_MAX_MB, multiprocess=True):
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.multiprocess = multiprocess
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+
+        # isolation_level=None: транзакциями управляем сами
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        if multiprocess:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA busy_timeout=30000')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    def get(self, key):
+        """Возвращает сохраненный ответ (строку JSON) или None"""
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        """Сохраняет ответ и при необходимости вытесняет давно не использованные записи"""
+        size = len(value.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE' if self.multiprocess else 'BEGIN')
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                    (key, value, size, now, now)
+                )
+                self.stores += 1
+                self._evict()
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def discard(self, key):
+        """Удаляет негодную запись; попадание по ней считается промахом"""
+        with self._lock:
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self.hits -= 1
+            self.misses += 1
+
+    def _evict(self):
+        """Удаляет самые старые по доступу записи, пока кеш больше лимита"""
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute('SELECT key, size FROM responses ORDER BY accessed ASC')
+        to_delete = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', to_delete)
+        self.evictions += len(to_delete)
+
+    def stats(self):
+        """Счетчики попаданий и промахов и текущий размер кеша"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'entries': entries,
+            'size_bytes': size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cached_chat_completion(client, cache, refresh=False, **request_params):
+    """Вызывает chat.completions.create через кеш.
+
+    Возвращает объект ChatCompletion: из кеша он восстанавливается из
+    сохраненного JSON, так что вызывающий код работает с ним как обычно.
+    С refresh (повтор запроса вызывающим кодом) кеш не читается, новый
+    ответ заменяет запись.
+    """
+    if cache is None:
+        return client.chat.completions.create(**request_params)
+
+    key = make_cache_key(request_params)
+    if not refresh:
+        cached = load_cached(cache, key, request_params)
+        if cached is not None:
+            return cached
+
+    response = client.chat.completions.create(**request_params)
+    store_response(cache, key, response, request_params)
+    return response
+
+
+async def cached_chat_completion_async(create, cache, refresh=False, **request_params):
+    """Асинхронный вариант cached_chat_completion.
+
+    create - корутинная функция, выполняющая сам запрос (например, с учетом
+    лимитов частоты); вызывается только при промахе кеша или с refresh.
+    """
+    if cache is None:
+        return await create(**request_params)
+
+    key = make_cache_key(request_params)
+    if not refresh:
+        cached = load_cached(cache, key, request_params)
+        if cached is not None:
+            return cached
+
+    response = await create(**request_params)
+    store_response(cache, key, response, request_params)
+    return response
@@ -0,0 +1,166 @@
+"""Асинхронное выполнение запросов к OpenAI API с ограничением параллельности"""
+import asyncio
+import functools
+import os
+import threading
+import time
+
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+
+from api_cache import cached_chat_completion_async
+from rate_limiter import DEFAULT_MAX_RETRIES, RateLimiter, estimate_request_tokens, retry_after_seconds
+
+DEFAULT_API_CONCURRENCY = int(os.getenv('BRAND_ANALYZER_API_CONCURRENCY', '8'))
+
+
+class AsyncApiEngine:
+    """Выполняет запросы через AsyncOpenAI в отдельном потоке с event loop.
+
+    Вызывающий код остается синхронным: submit() возвращает
+    concurrent.futures.Future, create() дожидается результата. Одновременно
+    к API уходит не больше concurrency запросов, остальные ждут в очереди.
+
+    shared_limiter - необязательный семафор с методами acquire()/release(),
+    общий для нескольких процессов (например, из multiprocessing.Manager).
+    Он ограничивает суммарную параллельность всех движков пакетного режима.
+
+    Частоту запросов и токенов в минуту держит rate_limiter (RateLimiter):
+    он же решает, сколько ждать перед повтором после 429, ошибки сервера
+    или обрыва соединения. Собственные повторы клиента OpenAI отключены,
+    чтобы задержки не складывались.
+
+    on_call - необязательный обратный вызов для метрик: после каждого
+    запроса получает словарь с меткой (label) и номером слайда, временем
+    ожидания в очереди, задержкой, числом повторов, исходом (ok/cached/error)
+    и токенами из response.usage. Вызывается из потока движка.
+    """
+
+    def __init__(self, api_key, concurrency=DEFAULT_API_CONCURRENCY, cache=None,
+                 shared_limiter=None, rate_limiter=None, max_retries=DEFAULT_MAX_RETRIES,
+                 on_call=None, **client_kwargs):
+        self.concurrency = max(1, int(concurrency))
+        self.cache = cache
+        self.shared_limiter = shared_limiter
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.on_call = on_call
+        client_kwargs.setdefault('max_retries', 0)
+        self.client = AsyncOpenAI(api_key=api_key, **client_kwargs)
+        self.in_flight = 0
+        self.completed = 0
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='api-engine', daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    async def _create(self, request_params, call, refresh=False):
+        submitted = time.perf_counter()
+        async with self._semaphore:
+            if self.shared_limiter is not None:
+                # Блокирующее ожидание общего семафора - в пуле потоков, не в event loop
+                await self._loop.run_in_executor(None, self.shared_limiter.acquire)
+            self.in_flight += 1
+            started = time.perf_counter()
+            call.update(start=started, queue_seconds=started - submitted, outcome='cached', retries=0)
+            try:
+                response = await cached_chat_completion_async(
+                    functools.partial(self._request, call), self.cache, refresh, **request_params
+                )
+                usage = response.usage
+                if usage is not None and call['outcome'] != 'cached':
+                    details = usage.prompt_tokens_details
+                    call.update(
+                        prompt_tokens=usage.prompt_tokens,
+                        completion_tokens=usage.completion_tokens,
+                        cached_tokens=(details.cached_tokens or 0) if details is not None else 0
+                    )
+                return response
+            except Exception as e:
+                call.update(outcome='error', error=type(e).__name__)
+                raise
+            finally:
+                call['latency_seconds'] = time.perf_counter() - started
+                self.in_flight -= 1
+                self.completed += 1
+                if self.shared_limiter is not None:
+                    self.shared_limiter.release()
+                if self.on_call is not None:
+                    self.on_call(call)
+
+    async def _request(self, call, **request_params):
+        """Запрос к API с учетом лимитов RPM/TPM и повторами при временных ошибках"""
+        limiter = self.rate_limiter
+        estimated_tokens = estimate_request_tokens(request_params)
+        call['outcome'] = 'ok'
+        for attempt in range(self.max_retries + 1):
+            call['retries'] = attempt
+            await limiter.acquire(estimated_tokens)
+            started = time.monotonic()
+            try:
+                raw = await self.client.chat.completions.with_raw_response.create(**request_params)
+            except APIStatusError as e:
+                limiter.record_request(time.monotonic() - started)
+                if attempt == self.max_retries or not (e.status_code == 429 or e.status_code >= 500):
+                    raise
+                if e.status_code == 429:
+                    delay = limiter.on_rate_limited(e.response.headers, attempt)
+                else:
+                    delay = limiter.backoff_delay(attempt, retry_after_seconds(e.response.headers))
+                await limiter.sleep_before_retry(delay)
+                continue
+            except APIConnectionError:
+                # Включает тайм-ауты (APITimeoutError)
+                limiter.record_request(time.monotonic() - started)
+                if attempt == self.max_retries:
+                    raise
+                await limiter.sleep_before_retry(limiter.backoff_delay(attempt))
+                continue
+
+            limiter.record_request(time.monotonic() - started)
+            limiter.update_from_headers(raw.headers)
+            response = raw.parse()
+            if response.usage is not None:
+                limiter.adjust_tokens(estimated_tokens, response.usage.total_tokens)
+            return response
+
+    def submit(self, label=None, slide=None, refresh=False, **request_params):
+        """Ставит запрос в очередь и возвращает Future с ответом ChatCompletion.
+
+        label и slide (тип запроса и номер слайда) в API не передаются,
+        они нужны только для метрик. refresh - повтор запроса вызывающим
+        кодом: ответ из кеша не используется.
+        """
+        call = {'label': label, 'slide': slide, 'model': request_params.get('model')}
+        return asyncio.run_coroutine_threadsafe(self._create(request_params, call, refresh), self._loop)
+
+    def create(self, label=None, slide=None, refresh=False, **request_params):
+        """Синхронный запрос: дожидается ответа"""
+        return self.submit(label, slide, refresh, **request_params).result()
+
+    async def _shutdown(self):
+        """Отменяет все незавершенные запросы и закрывает клиент"""
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        # Отмена доходит до задач (и до связанных с ними Future) до остановки loop
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.client.close()
+
+    def close(self):
+        """Отменяет незавершенные запросы, закрывает клиент и останавливает event loop.
+
+        Future отмененных запросов получают CancelledError, так что ожидающий
+        их код не блокируется навсегда.
+        """
+        if not self._loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=10)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
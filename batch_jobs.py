@@ -0,0 +1,412 @@
+"""Офлайн-режим: независимые запросы презентации пакетными заданиями в стиле OpenAI Batch API.
+
+Запросы записываются в JSONL (по строке {"custom_id", "method", "url", "body"}),
+большие наборы делятся на несколько файлов в пределах лимитов Batch API,
+файлы загружаются, задания создаются и опрашиваются до завершения, после
+чего результаты разбираются обратно в ответы ChatCompletion. Транспорт
+заменяемый: OpenAIBatchTransport работает с настоящим Batch API,
+LocalBatchTransport - файловая замена для тестов и прогонов без сети.
+"""
+import json
+import os
+import time
+import uuid
+from concurrent.futures import Future
+
+from api_cache import load_cached, make_cache_key, store_response
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+COMPLETION_WINDOW = '24h'
+DEFAULT_BATCH_DIR = os.getenv('BRAND_ANALYZER_BATCH_DIR', 'batches')
+# Интервал опроса задания и предельное время ожидания, секунды
+DEFAULT_POLL_SECONDS = float(os.getenv('BRAND_ANALYZER_BATCH_POLL', '60'))
+DEFAULT_BATCH_TIMEOUT = float(os.getenv('BRAND_ANALYZER_BATCH_TIMEOUT', str(25 * 3600)))
+
+# Пределы одного задания Batch API: входной файл до 200 МБ и до 50 000 запросов.
+# Файл закрывается с запасом, следующие запросы уходят в новое задание.
+MAX_BATCH_FILE_BYTES = int(os.getenv('BRAND_ANALYZER_BATCH_MAX_BYTES', str(190 * 1024 * 1024)))
+MAX_BATCH_REQUESTS = 50000
+
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class BatchError(Exception):
+    """Ошибка пакетного задания или отдельного запроса в нем"""
+
+
+def batch_line(custom_id, request_params):
+    """Строка входного файла Batch API"""
+    return {'custom_id': custom_id, 'method': 'POST', 'url': BATCH_ENDPOINT, 'body': request_params}
+
+
+def encode_batch_line(custom_id, request_params):
+    """Строка входного файла в байтах (UTF-8, с переводом строки)"""
+    return (json.dumps(batch_line(custom_id, request_params), ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def parse_batch_output(text):
+    """Разбирает выходной (или error) файл: {custom_id: ChatCompletion или BatchError}"""
+    from openai.types.chat import ChatCompletion
+
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        response = entry.get('response') or {}
+        error = entry.get('error')
+        if error is None and response.get('status_code', 200) == 200:
+            results[entry['custom_id']] = ChatCompletion.model_validate(response['body'])
+        else:
+            error = error or (response.get('body') or {}).get('error') or {}
+            message = error.get('message') if isinstance(error, dict) else str(error)
+            results[entry['custom_id']] = BatchError(
+                f"{message or 'ошибка запроса'} (HTTP {response.get('status_code', '-')})"
+            )
+    return results
+
+
+class OpenAIBatchTransport:
+    """Batch API OpenAI: загрузка файла, создание и опрос задания, выгрузка результатов"""
+
+    def __init__(self, api_key=None, **client_kwargs):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=api_key or os.getenv('OPENAI_API_KEY'), **client_kwargs)
+
+    def upload(self, path):
+        with open(path, 'rb') as f:
+            return self.client.files.create(file=f, purpose='batch').id
+
+    def create(self, input_file_id, metadata=None):
+        batch = self.client.batches.create(
+            input_file_id=input_file_id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=COMPLETION_WINDOW,
+            metadata=metadata
+        )
+        return batch.id
+
+    def retrieve(self, batch_id):
+        """Состояние задания: {'status', 'output_file_id', 'error_file_id', 'request_counts'}"""
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            'status': batch.status,
+            'output_file_id': batch.output_file_id,
+            'error_file_id': batch.error_file_id,
+            'request_counts': counts.model_dump() if counts is not None else {},
+        }
+
+    def download(self, file_id):
+        return self.client.files.content(file_id).text
+
+    def cancel(self, batch_id):
+        self.client.batches.cancel(batch_id)
+
+
+class LocalBatchTransport:
+    """Файловая замена Batch API.
+
+    Файлы и задания хранятся в root_dir (files/, batches/). Задание
+    выполняется при опросе номер polls_to_complete: каждая строка входного
+    файла получает ответ respond(body) - по умолчанию заготовку
+    fake_openai_server, - а доля error_rate строк завершается ошибкой 500.
+    """
+
+    def __init__(self, root_dir, respond=None, polls_to_complete=1, error_rate=0.0, seed=None):
+        import random
+
+        self.root_dir = root_dir
+        self.respond = respond
+        self.polls_to_complete = max(1, int(polls_to_complete))
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        for name in ('files', 'batches'):
+            os.makedirs(os.path.join(root_dir, name), exist_ok=True)
+
+    def _file_path(self, file_id):
+        return os.path.join(self.root_dir, 'files', f"{file_id}.jsonl")
+
+    def _batch_path(self, batch_id):
+        return os.path.join(self.root_dir, 'batches', f"{batch_id}.json")
+
+    def _save_batch(self, batch):
+        with open(self._batch_path(batch['id']), 'w', encoding='utf-8') as f:
+            json.dump(batch, f, ensure_ascii=False, indent=2)
+
+    def upload(self, path):
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with open(path, encoding='utf-8') as src, open(self._file_path(file_id), 'w', encoding='utf-8') as dst:
+            dst.write(src.read())
+        return file_id
+
+    def create(self, input_file_id, metadata=None):
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        self._save_batch({
+            'id': batch_id,
+            'status': 'validating',
+            'input_file_id': input_file_id,
+            'output_file_id': None,
+            'error_file_id': None,
+            'request_counts': {},
+            'metadata': metadata,
+            'polls': 0,
+        })
+        return batch_id
+
+    def retrieve(self, batch_id):
+        with open(self._batch_path(batch_id), encoding='utf-8') as f:
+            batch = json.load(f)
+        if batch['status'] not in FINAL_STATUSES:
+            batch['polls'] += 1
+            if batch['polls'] >= self.polls_to_complete:
+                self._execute(batch)
+            else:
+                batch['status'] = 'in_progress'
+            self._save_batch(batch)
+        return {key: batch[key] for key in ('status', 'output_file_id', 'error_file_id', 'request_counts')}
+
+    def _execute(self, batch):
+        """Отвечает на все запросы задания, как это сделал бы удаленный сервис"""
+        if self.respond is None:
+            from fake_openai_server import make_completion
+            respond = make_completion
+        else:
+            respond = self.respond
+
+        outputs, errors = [], []
+        with open(self._file_path(batch['input_file_id']), encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                entry = {'id': f"batch_req_{uuid.uuid4().hex[:24]}", 'custom_id': request['custom_id']}
+                if self.random.random() < self.error_rate:
+                    entry['response'] = {'status_code': 500, 'body': {
+                        'error': {'message': 'Injected server error', 'type': 'server_error'}
+                    }}
+                    errors.append(entry)
+                else:
+                    entry['response'] = {'status_code': 200, 'body': respond(request['body'])}
+                    outputs.append(entry)
+
+        for key, entries in (('output_file_id', outputs), ('error_file_id', errors)):
+            if entries:
+                file_id = f"file-{uuid.uuid4().hex[:24]}"
+                with open(self._file_path(file_id), 'w', encoding='utf-8') as f:
+                    f.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+                batch[key] = file_id
+        batch['status'] = 'completed'
+        batch['request_counts'] = {
+            'total': len(outputs) + len(errors), 'completed': len(outputs), 'failed': len(errors)
+        }
+
+    def download(self, file_id):
+        with open(self._file_path(file_id), encoding='utf-8') as f:
+            return f.read()
+
+    def cancel(self, batch_id):
+        with open(self._batch_path(batch_id), encoding='utf-8') as f:
+            batch = json.load(f)
+        if batch['status'] not in FINAL_STATUSES:
+            batch['status'] = 'cancelled'
+            self._save_batch(batch)
+
+
+class BatchPart:
+    """Входной файл одного задания: запросы дописываются в него сразу при отправке"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.bytes = 0
+        self.requests = []  # (custom_id, ключ кеша, response_format запроса, запись для метрик, Future)
+        self.batch_id = None
+
+    def fits(self, size, max_bytes, max_requests):
+        if not self.requests:
+            return True
+        return self.bytes + size <= max_bytes and len(self.requests) < max_requests
+
+    def write(self, line, request):
+        self.file.write(line)
+        self.bytes += len(line)
+        self.requests.append(request)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class BatchSession:
+    """Собирает независимые запросы и выполняет их пакетными заданиями.
+
+    submit() повторяет интерфейс AsyncApiEngine.submit и возвращает
+    concurrent.futures.Future, но ответы приходят только после run().
+    Запрос сразу дописывается во входной JSONL и в памяти не хранится
+    (изображения слайдов можно освобождать сразу после submit). Когда файл
+    подходит к пределам Batch API, следующие запросы пишутся в новый файл,
+    и run() отправляет по заданию на файл. Ответы из кеша не попадают
+    в задание, новые ответы сохраняются в кеш. on_call получает записи для
+    метрик в том же формате, что и у движка API.
+    """
+
+    def __init__(self, transport, work_dir=DEFAULT_BATCH_DIR, cache=None, poll_seconds=DEFAULT_POLL_SECONDS,
+                 timeout=DEFAULT_BATCH_TIMEOUT, on_call=None, on_status=None,
+                 max_file_bytes=MAX_BATCH_FILE_BYTES, max_requests=MAX_BATCH_REQUESTS):
+        self.transport = transport
+        self.work_dir = work_dir
+        self.cache = cache
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+        self.on_call = on_call
+        self.on_status = on_status
+        self.max_file_bytes = max_file_bytes
+        self.max_requests = max_requests
+        self.parts = []
+        self.submitted = 0
+
+    def submit(self, label=None, slide=None, refresh=False, **request_params):
+        future = Future()
+        call = {'label': label, 'slide': slide, 'model': request_params.get('model'), 'retries': 0}
+        cache_key = make_cache_key(request_params) if self.cache is not None else None
+        if cache_key is not None and not refresh:
+            cached = load_cached(self.cache, cache_key, request_params)
+            if cached is not None:
+                future.set_result(cached)
+                self._record(dict(call, outcome='cached', latency_seconds=0.0))
+                return future
+        custom_id = f"{label or 'request'}-{slide if slide is not None else '-'}-{self.submitted}"
+        self.submitted += 1
+        line = encode_batch_line(custom_id, request_params)
+        check_params = {'response_format': request_params.get('response_format')}
+        self._part_for(len(line)).write(line, (custom_id, cache_key, check_params, call, future))
+        return future
+
+    def _part_for(self, size):
+        """Текущий входной файл или новый, если строка в текущий не помещается"""
+        if not self.parts or not self.parts[-1].fits(size, self.max_file_bytes, self.max_requests):
+            if self.parts:
+                self.parts[-1].close()
+            os.makedirs(self.work_dir, exist_ok=True)
+            self.parts.append(BatchPart(os.path.join(
+                self.work_dir, f"batch_{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}.jsonl"
+            )))
+        return self.parts[-1]
+
+    def _record(self, call):
+        if self.on_call is not None:
+            self.on_call(call)
+
+    def _status(self, message):
+        if self.on_status is not None:
+            self.on_status(message)
+
+    def run(self):
+        """Отправляет накопленные файлы заданиями и дожидается результатов. Возвращает id заданий.
+
+        Ошибка задания передается в Future его запросов; после разбора всех
+        заданий она пробрасывается (первая из них).
+        """
+        parts, self.parts = self.parts, []
+        if not parts:
+            return []
+        started = time.perf_counter()
+        errors = []
+        active = []
+        for part in parts:
+            part.close()
+            try:
+                file_id = self.transport.upload(part.path)
+                part.batch_id = self.transport.create(file_id, metadata={'source': 'brand_analyzer'})
+                self._status(f"Пакетное задание {part.batch_id}: отправлено запросов {len(part.requests)}")
+                active.append(part)
+            except Exception as e:
+                errors.append(e)
+                self._fail(part, e, started)
+
+        for part, outcome in self._wait(active):
+            if isinstance(outcome, Exception):
+                errors.append(outcome)
+                self._fail(part, outcome, started)
+            else:
+                self._deliver(part, outcome, time.perf_counter() - started)
+
+        if errors:
+            raise errors[0]
+        return [part.batch_id for part in active]
+
+    def _wait(self, parts):
+        """Опрашивает задания до завершения: [(часть, результаты {custom_id: ответ} или исключение)]"""
+        outcomes = []
+        deadline = time.monotonic() + self.timeout
+        while parts:
+            waiting = []
+            for part in parts:
+                try:
+                    state = self.transport.retrieve(part.batch_id)
+                except Exception as e:
+                    outcomes.append((part, e))
+                    continue
+                if state['status'] == 'completed':
+                    try:
+                        outcomes.append((part, self._results(state)))
+                    except Exception as e:
+                        outcomes.append((part, e))
+                elif state['status'] in FINAL_STATUSES:
+                    outcomes.append((part, BatchError(
+                        f"Пакетное задание {part.batch_id} завершилось со статусом {state['status']}"
+                    )))
+                else:
+                    counts = state.get('request_counts') or {}
+                    self._status(
+                        f"Пакетное задание {part.batch_id}: {state['status']}, "
+                        f"готово {counts.get('completed', 0)} из {counts.get('total', len(part.requests))}"
+                    )
+                    waiting.append(part)
+            parts = waiting
+            if parts and time.monotonic() >= deadline:
+                for part in parts:
+                    self.transport.cancel(part.batch_id)
+                    outcomes.append((part, BatchError(
+                        f"Пакетное задание {part.batch_id} не завершилось за {self.timeout:.0f} сек"
+                    )))
+                break
+            if parts:
+                time.sleep(self.poll_seconds)
+        return outcomes
+
+    def _results(self, state):
+        results = {}
+        for key in ('output_file_id', 'error_file_id'):
+            if state.get(key):
+                results.update(parse_batch_output(self.transport.download(state[key])))
+        return results
+
+    def _fail(self, part, error, started):
+        for _, _, _, call, future in part.requests:
+            future.set_exception(error)
+            self._record(dict(call, outcome='error', error=type(error).__name__,
+                              latency_seconds=time.perf_counter() - started))
+
+    def _deliver(self, part, results, elapsed):
+        """Передает ответы задания в Future его запросов"""
+        for custom_id, cache_key, check_params, call, future in part.requests:
+            result = results.get(custom_id, BatchError(f"Нет результата для {custom_id}"))
+            call['latency_seconds'] = elapsed
+            if isinstance(result, Exception):
+                future.set_exception(result)
+                self._record(dict(call, outcome='error', error=type(result).__name__))
+                continue
+            if cache_key is not None:
+                store_response(self.cache, cache_key, result, check_params)
+            usage = result.usage
+            if usage is not None:
+                details = usage.prompt_tokens_details
+                call.update(
+                    prompt_tokens=usage.prompt_tokens,
+                    completion_tokens=usage.completion_tokens,
+                    cached_tokens=(details.cached_tokens or 0) if details is not None else 0
+                )
+            future.set_result(result)
+            self._record(dict(call, outcome='ok'))
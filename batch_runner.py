@@ -0,0 +1,161 @@
+"""Пакетный анализ множества презентаций на пуле процессов"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from api_engine import DEFAULT_API_CONCURRENCY
+
+load_dotenv()
+
+DEFAULT_BATCH_WORKERS = int(os.getenv('BRAND_ANALYZER_BATCH_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+
+def load_jobs(source, default_context=None):
+    """Список заданий [{'pdf': путь, 'context': контекст}] из папки или манифеста.
+
+    Манифест - текстовый файл с путем к PDF в каждой строке или JSONL со
+    строками вида {"pdf": "...", "context": "..."}. Относительные пути
+    считаются от папки манифеста.
+    """
+    if os.path.isdir(source):
+        return [
+            {'pdf': os.path.join(source, name), 'context': default_context}
+            for name in sorted(os.listdir(source))
+            if name.lower().endswith('.pdf')
+        ]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    jobs = []
+    with open(source, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                entry = json.loads(line)
+                job = {'pdf': entry['pdf'], 'context': entry.get('context', default_context)}
+            else:
+                job = {'pdf': line, 'context': default_context}
+            if not os.path.isabs(job['pdf']):
+                job['pdf'] = os.path.join(base_dir, job['pdf'])
+            jobs.append(job)
+    return jobs
+
+
+def _analyze_deck(job, output_dir, api_limiter):
+    """Анализ одной презентации. Выполняется в процессе пула."""
+    from brand_engine import BrandAnalyzer, setup_logging
+
+    started = time.time()
+    summary = {'pdf': job['pdf'], 'status': 'ok', 'error': None}
+    analyzer = None
+    try:
+        # Рендеринг внутри процесса пакета - однопроцессный, параллельность дают сами задания
+        analyzer = BrandAnalyzer(
+            output_dir=output_dir,
+            logger=setup_logging(),
+            render_workers=1,
+            api_limiter=api_limiter
+        )
+        result = analyzer.analyze_pdf(job['pdf'], job.get('context'))
+        summary.update({
+            'slides': result['slides'],
+            'rendered_slides': analyzer.page_renderer.pages_rendered,
+            'analyzed_slides': len(result['results']),
+            'report_path': result['report_path'],
+            'guide_path': result['guide_path'],
+        })
+    except Exception as e:
+        summary['status'] = 'failed'
+        summary['error'] = str(e)
+    finally:
+        if analyzer is not None:
+            analyzer.close()
+    summary['seconds'] = round(time.time() - started, 2)
+    return summary
+
+
+def run_batch(jobs, workers=DEFAULT_BATCH_WORKERS, api_concurrency=DEFAULT_API_CONCURRENCY,
+              output_dir=None, on_done=None):
+    """Анализирует презентации на пуле процессов с общим лимитом запросов к API.
+
+    Возвращает сводку пакета; сводки по презентациям идут в порядке заданий.
+    """
+    started = time.time()
+    summaries = [None] * len(jobs)
+    with multiprocessing.Manager() as manager:
+        api_limiter = manager.BoundedSemaphore(api_concurrency)
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {
+                executor.submit(_analyze_deck, job, output_dir, api_limiter): index
+                for index, job in enumerate(jobs)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    # Процесс пула упал целиком (например, нехватка памяти)
+                    summary = {'pdf': jobs[index]['pdf'], 'status': 'failed', 'error': str(e), 'seconds': None}
+                summaries[index] = summary
+                if on_done:
+                    on_done(summary)
+
+    failed = [summary for summary in summaries if summary['status'] != 'ok']
+    return {
+        'started': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)),
+        'seconds': round(time.time() - started, 2),
+        'workers': workers,
+        'api_concurrency': api_concurrency,
+        'decks': len(jobs),
+        'succeeded': len(jobs) - len(failed),
+        'failed': len(failed),
+        'results': summaries,
+    }
+
+
+def save_batch_summary(summary, output_dir):
+    """Сохраняет сводку пакета в JSON и возвращает путь к файлу"""
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    summary_path = os.path.join(output_dir, f"batch_summary_{timestamp}.json")
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный анализ PDF-презентаций")
+    parser.add_argument('source', help="папка с PDF или манифест (строки с путями или JSONL)")
+    parser.add_argument('--context', default=None, help="контекст анализа по умолчанию для всех презентаций")
+    parser.add_argument('--output-dir', default=None, help="папка для отчетов (по умолчанию рядом с каждым PDF)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_BATCH_WORKERS, help="количество процессов")
+    parser.add_argument('--api-concurrency', type=int, default=DEFAULT_API_CONCURRENCY,
+                        help="общий лимит одновременных запросов к API")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.source, args.context)
+    if not jobs:
+        print("Не найдено ни одной презентации", file=sys.stderr)
+        return 2
+    if args.output_dir and not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    def on_done(deck):
+        status = "OK" if deck['status'] == 'ok' else f"ОШИБКА: {deck['error']}"
+        print(f"{os.path.basename(deck['pdf'])}: {status} ({deck['seconds']} сек)")
+
+    summary = run_batch(jobs, args.workers, args.api_concurrency, args.output_dir, on_done)
+    summary_dir = args.output_dir or (args.source if os.path.isdir(args.source) else os.path.dirname(args.source) or '.')
+    summary_path = save_batch_summary(summary, summary_dir)
+    print(f"Готово: {summary['succeeded']} из {summary['decks']} за {summary['seconds']} сек. Сводка: {summary_path}")
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
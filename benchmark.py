@@ -0,0 +1,178 @@
+"""Сквозной замер производительности конвейера на синтетических презентациях.
+
+Генерирует многостраничные PDF, направляет запросы к API на локальный
+fake_openai_server и выводит скорость (слайдов в секунду), пиковое
+потребление памяти и время этапов: render, resize, classify, encode,
+analyze, report, guide. Кеш ответов, журнал запуска и выгрузка метрик
+отдельных запусков на время замера отключены.
+
+    python benchmark.py --pages 10,50 --latency lognormal:0.8,0.4 --json benchmarks.json
+"""
+import os
+
+# До импорта движка: замер не должен зависеть от кеша и журналов прошлых запусков
+os.environ.setdefault('BRAND_ANALYZER_CACHE', '0')
+os.environ.setdefault('BRAND_ANALYZER_JOURNAL', '0')
+os.environ.setdefault('BRAND_ANALYZER_METRICS', '0')
+
+import argparse
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+
+from reportlab.lib.pagesizes import landscape, A4
+from reportlab.pdfgen import canvas
+
+from brand_engine import BrandAnalyzer
+from fake_openai_server import FakeOpenAIServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PALETTE = ['#1a237e', '#e53935', '#fdd835', '#43a047', '#212121', '#f5f5f5', '#8e24aa']
+
+
+def make_synthetic_pdf(path, pages, seed=0, text_every=5, duplicate_every=7):
+    """Создает PDF с графическими, текстовыми и почти одинаковыми слайдами.
+
+    Каждый text_every-й слайд - плотный текст, каждый duplicate_every-й -
+    вариант предыдущего с другим цветом акцента.
+    """
+    rng = random.Random(seed)
+    width, height = landscape(A4)
+    pdf = canvas.Canvas(path, pagesize=(width, height))
+    previous = None
+    for page in range(1, pages + 1):
+        if page % text_every == 0:
+            pdf.setFont('Helvetica', 11)
+            for line in range(40):
+                words = " ".join(rng.choice(['brand', 'design', 'system', 'grid', 'colour', 'type'])
+                                 for _ in range(14))
+                pdf.drawString(40, height - 40 - line * 13, words)
+        else:
+            if page % duplicate_every == 0 and previous is not None:
+                shapes = [dict(shape) for shape in previous]
+                shapes[0]['color'] = rng.choice(PALETTE)
+            else:
+                shapes = [
+                    {
+                        'kind': rng.choice(['rect', 'circle']),
+                        'x': rng.uniform(0, width * 0.8),
+                        'y': rng.uniform(0, height * 0.8),
+                        'size': rng.uniform(40, 220),
+                        'color': rng.choice(PALETTE),
+                    }
+                    for _ in range(rng.randint(3, 9))
+                ]
+            pdf.setFillColor(PALETTE[5])
+            pdf.rect(0, 0, width, height, stroke=0, fill=1)
+            for shape in shapes:
+                pdf.setFillColor(shape['color'])
+                if shape['kind'] == 'rect':
+                    pdf.rect(shape['x'], shape['y'], shape['size'], shape['size'] * 0.6, stroke=0, fill=1)
+                else:
+                    pdf.circle(shape['x'], shape['y'], shape['size'] / 2, stroke=0, fill=1)
+            pdf.setFillColor(PALETTE[4])
+            pdf.setFont('Helvetica-Bold', 28)
+            pdf.drawString(40, 40, f"Slide {page}")
+            previous = shapes
+        pdf.showPage()
+    pdf.save()
+    return path
+
+
+def peak_rss_mb():
+    """Пиковая память процесса и дочерних процессов рендеринга, МБ (None на Windows)"""
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss: байты на macOS, КБ на Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round((own + children) / scale, 1)
+
+
+def run_benchmark(pages, server, work_dir, render_workers=None, create_guide=True, seed=0):
+    """Анализ одной синтетической презентации, возвращает словарь с метриками"""
+    pdf_path = make_synthetic_pdf(os.path.join(work_dir, f"synthetic_{pages}.pdf"), pages, seed=seed)
+    analyzer = BrandAnalyzer(
+        api_key='benchmark',
+        base_url=server.base_url,
+        output_dir=work_dir,
+        create_guide=create_guide,
+        render_workers=render_workers
+    )
+    requests_before = server.stats['requests']
+    try:
+        started = time.perf_counter()
+        result = analyzer.analyze_pdf(pdf_path)
+        wall_seconds = time.perf_counter() - started
+        limiter_stats = analyzer.api_engine.rate_limiter.stats()
+        stages = analyzer.metrics.summary()
+        tokens = analyzer.metrics.token_totals()
+    finally:
+        analyzer.close()
+    return {
+        'pages': pages,
+        'analyzed': len(result['results']),
+        'wall_seconds': round(wall_seconds, 3),
+        'slides_per_second': round(pages / wall_seconds, 3) if wall_seconds else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stages,
+        'api_requests': server.stats['requests'] - requests_before,
+        'api_retries': limiter_stats['retries'],
+        'tokens': tokens,
+    }
+
+
+def format_result(result):
+    stages = ", ".join(f"{name} {seconds:.2f}" for name, seconds in result['stages'].items())
+    return (
+        f"{result['pages']:>4} стр.: {result['slides_per_second']:.2f} слайдов/сек, "
+        f"{result['wall_seconds']:.1f} сек, пик памяти {result['peak_rss_mb']} МБ, "
+        f"запросов {result['api_requests']} (повторов {result['api_retries']})\n"
+        f"      этапы (сек): {stages}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер производительности конвейера анализа")
+    parser.add_argument('--pages', default='10,50', help="размеры синтетических презентаций через запятую")
+    parser.add_argument('--latency', default='lognormal:0.8,0.4', help="задержка fake API (см. fake_openai_server)")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--render-workers', type=int, default=None)
+    parser.add_argument('--no-guide', action='store_true', help="не замерять создание гайда")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help="сохранить результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    results = []
+    with FakeOpenAIServer(latency=args.latency, error_rate=args.error_rate,
+                          rate_limit_rate=args.rate_limit_rate, seed=args.seed) as server:
+        with tempfile.TemporaryDirectory(prefix='brand_benchmark_') as work_dir:
+            for pages in [int(value) for value in args.pages.split(',')]:
+                result = run_benchmark(pages, server, work_dir, args.render_workers,
+                                       not args.no_guide, args.seed)
+                results.append(result)
+                print(format_result(result))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'latency': args.latency,
+                'error_rate': args.error_rate,
+                'rate_limit_rate': args.rate_limit_rate,
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1542 @@
+"""Движок анализа презентаций без графического интерфейса.
+
+BrandAnalyzer содержит весь конвейер: рендеринг, классификацию слайдов,
+запросы к API, контекст презентации, отчет и презентационный гайд.
+GUI (pdf_brand_analyzer.py) и CLI работают через него.
+"""
+import argparse
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import cached_property
+from logging.handlers import QueueHandler, QueueListener
+
+from dotenv import load_dotenv
+
+from api_cache import open_default_cache
+from context_window import RollingContext, count_tokens
+from run_journal import open_run_journal
+from run_metrics import METRICS_ENABLED, RunMetrics
+
+# Тяжелые зависимости (openai, numpy, PIL, pdf2image, reportlab) импортируются
+# при первом использовании этапа, а не при запуске приложения: компоненты
+# движка создаются лениво (cached_property), модули этапов импортируются в методах.
+
+load_dotenv()
+
+# На сколько слайдов применение извлечений контекста (update_presentation_context)
+# отстает от текущего: для слайда N применяются ровно извлечения слайдов до
+# N - CONTEXT_UPDATE_LAG - 1 включительно, более новые - никогда, поэтому промпт
+# не зависит от скорости ответов API. Последние комментарии сами попадают
+# в get_brief_context, поэтому ключевые элементы из них можно получить позже.
+CONTEXT_UPDATE_LAG = 2
+
+# Режим анализа слайда:
+# 'combined' - один структурированный запрос возвращает и рассказ о слайде,
+#              и ключевые элементы/решения/связи для контекста;
+# 'separate' - прежний путь из двух запросов (рассказ + отдельное извлечение).
+CONTEXT_MODE = os.getenv('BRAND_ANALYZER_CONTEXT_MODE', 'combined')
+
+# Режим обработки почти одинаковых слайдов:
+# 'off'   - каждый слайд анализируется полностью;
+# 'reuse' - вариант получает анализ первого слайда группы без запросов к API;
+# 'diff'  - для варианта делается один дешевый запрос только про отличия.
+DEDUP_MODE = os.getenv('BRAND_ANALYZER_DEDUP', 'reuse')
+
+# Инкрементальный анализ новых версий презентации (deck_versions): слайды,
+# не изменившиеся с прошлого запуска, берутся из его результатов
+INCREMENTAL_MODE = os.getenv('BRAND_ANALYZER_INCREMENTAL', '0') != '0'
+
+# Локальные признаки слайда (палитра, пустое пространство, сетка заполненности)
+# в промптах и в гайде; '0' - отключить
+FEATURE_HINTS = os.getenv('BRAND_ANALYZER_FEATURE_HINTS', '1') != '0'
+
+# Предварительный разбор PDF утилитами poppler (pdf_preflight): текстовые
+# страницы определяются по текстовому слою и не рендерятся; '0' - отключить
+PREFLIGHT_MODE = os.getenv('BRAND_ANALYZER_PREFLIGHT', '1') != '0'
+
+# Схема ответа для режима 'combined' (structured outputs)
+SLIDE_ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "slide_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "narration": {"type": "string"},
+                "key_elements": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string"},
+                            "description": {"type": "string"}
+                        },
+                        "required": ["name", "description"],
+                        "additionalProperties": False
+                    }
+                },
+                "design_decisions": {"type": "array", "items": {"type": "string"}},
+                "connections": {"type": "array", "items": {"type": "string"}}
+            },
+            "required": ["narration", "key_elements", "design_decisions", "connections"],
+            "additionalProperties": False
+        }
+    }
+}
+
+
+def setup_logging(log_dir="logs"):
+    """Настраивает систему логирования.
+    
+    Запись в файл и в консоль идет в фоновом потоке (QueueListener):
+    рабочие потоки только кладут запись в очередь и не ждут ввода-вывода.
+    """
+    logger = logging.getLogger('brand_analyzer')
+    # Повторная настройка не нужна (как и у logging.basicConfig)
+    if logging.getLogger().handlers:
+        return logger
+    
+    # Создаем папку для логов если её нет
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    
+    # Формируем имя файла лога с текущей датой
+    log_file = os.path.join(log_dir, f"analysis_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+    
+    # Настраиваем формат логирования
+    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    handlers = [
+        logging.FileHandler(log_file, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем оставшиеся в очереди записи
+    atexit.register(listener.stop)
+    
+    # Форматирование выполняют обработчики в потоке QueueListener
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(QueueHandler(log_queue))
+    
+    logger.info("=== Запуск нового анализа ===")
+    return logger
+
+
+class BrandAnalyzer:
+    """Конвейер анализа презентации.
+    
+    Интерфейс получает события через необязательные обратные вызовы:
+    on_log (строки журнала), on_status (статус), on_progress (проценты)
+    и on_result (результаты по слайдам). Сам движок не зависит от tkinter.
+    """
+    
+    def __init__(self, api_key=None, output_dir=None, create_guide=True, on_log=None,
+                 on_status=None, on_progress=None, on_result=None, logger=None,
+                 render_workers=None, api_limiter=None, base_url=None, batch_transport=None):
+        self.logger = logger or logging.getLogger('brand_analyzer')
+        self.on_log = on_log
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self.on_result = on_result
+        self.output_dir = output_dir
+        self.create_guide = create_guide
+        self.user_context = None
+        self.journal = None
+        
+        # Получаем API ключ из переменной окружения
+        api_key = api_key or os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("Не найден API ключ OpenAI. Установите переменную окружения OPENAI_API_KEY")
+        
+        # Постоянный кеш ответов API (повторные запуски не платят за неизмененные слайды)
+        try:
+            self.response_cache = open_default_cache()
+        except Exception as e:
+            self.response_cache = None
+            self.log_event(f"Кеш ответов API недоступен: {str(e)}", level='warning')
+        
+        # Метрики запуска: интервалы этапов и записи о запросах к API
+        self.metrics = RunMetrics()
+        
+        # Параметры компонентов, которые создаются при первом использовании
+        self._api_key = api_key
+        self._base_url = base_url
+        self._api_limiter = api_limiter
+        self._render_workers = render_workers
+        
+        # Транспорт пакетных заданий (batch_jobs): если задан, независимые
+        # запросы презентации уходят одним заданием вместо запросов в реальном времени
+        self.batch_transport = batch_transport
+        
+        self.context_mode = CONTEXT_MODE
+        self.dedup_mode = DEDUP_MODE
+        self.incremental = INCREMENTAL_MODE
+        self.feature_hints = FEATURE_HINTS
+        self.preflight = PREFLIGHT_MODE
+        self.reset_contexts()
+        
+        # Запрос остановки анализа (например, при закрытии окна): проверяется
+        # между слайдами, незавершенные слайды остаются в журнале для продолжения
+        self.stop_requested = threading.Event()
+        
+        self.start_time = 0
+    
+    @cached_property
+    def api_engine(self):
+        """Асинхронный движок запросов к OpenAI (создается при первом запросе)"""
+        from api_engine import AsyncApiEngine
+        
+        # base_url позволяет направить запросы на совместимый сервер, например на fake_openai_server
+        client_kwargs = {'base_url': self._base_url} if self._base_url else {}
+        try:
+            return AsyncApiEngine(
+                api_key=self._api_key,
+                cache=self.response_cache,
+                shared_limiter=self._api_limiter,
+                default_headers={"OpenAI-Beta": "assistants=v1"},
+                on_call=self.metrics.record_api_call,
+                **client_kwargs
+            )
+        except Exception as e:
+            self.log_event(f"Ошибка инициализации OpenAI клиента: {str(e)}", level='error')
+            raise
+    
+    @cached_property
+    def page_renderer(self):
+        """Рендеринг страниц: пул процессов, окна страниц, выдача по порядку"""
+        from slide_render import PageRenderer
+        if self._render_workers is None:
+            return PageRenderer()
+        return PageRenderer(workers=self._render_workers)
+    
+    @cached_property
+    def detail_planner(self):
+        """Выбор разрешения и detail изображений в рамках бюджета токенов"""
+        from detail_planner import DetailPlanner
+        return DetailPlanner()
+    
+    @cached_property
+    def text_classifier(self):
+        """Классификатор текстовых слайдов (порог по всей презентации, результат запоминается)"""
+        from slide_classifier import TextSlideClassifier
+        return TextSlideClassifier()
+    
+    @cached_property
+    def feature_extractor(self):
+        """Палитра и расположение элементов по пикселям слайда (результат запоминается)"""
+        from slide_features import SlideFeatureExtractor
+        return SlideFeatureExtractor()
+    
+    @cached_property
+    def duplicate_index(self):
+        """Индекс почти одинаковых слайдов (варианты логотипов, цветов, мокапов)"""
+        from slide_dedup import DuplicateIndex
+        return DuplicateIndex()
+    
+    def reset_contexts(self):
+        """Сбрасывает контексты перед анализом новой презентации"""
+        self.analysis_context = {
+            'design_systems': [],
+            'variants': {},
+            'elements': {},
+            'slides_map': {}
+        }
+        
+        # Контекст презентации постоянного размера с бюджетом токенов
+        self.presentation_context = RollingContext()
+        
+        # Извлечения контекста, которые еще выполняются: (слайд, анализ, Future)
+        self.pending_context_updates = deque()
+        
+        # Изменения контекста презентации в порядке применения (события comment/merge,
+        # как в журнале запуска) - по ним контекст восстанавливается в следующей версии
+        self.context_events = []
+    
+    def log_event(self, message, level='info'):
+        """Логирует событие и передает его интерфейсу"""
+        if level == 'error':
+            self.logger.error(message)
+        elif level == 'warning':
+            self.logger.warning(message)
+        else:
+            self.logger.info(message)
+        
+        if self.on_log:
+            self.on_log(message)
+    
+    def update_status(self, message):
+        """Передает статус интерфейсу"""
+        if self.on_status:
+            self.on_status(message)
+    
+    def report_progress(self, progress):
+        """Передает прогресс анализа в процентах"""
+        if self.on_progress:
+            self.on_progress(progress)
+    
+    def emit_result(self, message):
+        """Передает результат анализа слайда"""
+        if self.on_result:
+            self.on_result(message)
+    
+    def request_stop(self):
+        """Просит остановить анализ после текущего слайда (можно вызывать из любого потока)"""
+        self.stop_requested.set()
+    
+    def close(self):
+        """Освобождает ресурсы движка"""
+        # Движок API закрываем, только если он успел создаться
+        if 'api_engine' in self.__dict__:
+            self.api_engine.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+    
+    @contextmanager
+    def independent_requests(self):
+        """Функция submit для независимых запросов (как у AsyncApiEngine).
+
+        В пакетном режиме запросы сразу пишутся во входные файлы и при выходе
+        из блока отправляются заданиями (одним, если файл не превысил лимиты
+        Batch API); Future получают ответы после завершения заданий.
+        """
+        if self.batch_transport is None:
+            yield self.api_engine.submit
+            return
+        
+        from batch_jobs import DEFAULT_BATCH_DIR, BatchSession
+        session = BatchSession(
+            self.batch_transport,
+            work_dir=os.path.join(self.output_dir, DEFAULT_BATCH_DIR) if self.output_dir else DEFAULT_BATCH_DIR,
+            cache=self.response_cache,
+            on_call=self.metrics.record_api_call,
+            on_status=self.update_status
+        )
+        yield session.submit
+        try:
+            batch_ids = session.run()
+            if batch_ids:
+                self.log_event(f"Пакетные задания завершены: {', '.join(batch_ids)}")
+        except Exception as e:
+            # Ошибка уже передана во все Future задания, их разбирает вызывающий код
+            self.log_event(f"Ошибка пакетного задания: {str(e)}", level='error')
+    
+    def convert_pdf_to_images(self, pdf_path, first_page=1, last_page=None, skip=None):
+        """Потоково конвертирует PDF в слайды в памяти, отдавая их по готовности.
+        
+        Страницы из skip не рендерятся.
+        """
+        from slide_image import THUMBNAIL_SIZE, SlideImage
+        
+        try:
+            pages = self.page_renderer.iter_pages(
+                pdf_path,
+                first_page=first_page,
+                last_page=last_page,
+                skip=skip
+            )
+            while True:
+                with self.metrics.stage('render') as span:
+                    page = next(pages, None)
+                    if page is None:
+                        break
+                    span['slide'] = page[0]
+                with self.metrics.stage('resize', slide=page[0]):
+                    # Страница уже отрендерена в размере API (RenderPolicy),
+                    # миниатюра для гайда делается сразу, пока страница в памяти
+                    slide = SlideImage.from_render(
+                        *page, thumbnail_size=THUMBNAIL_SIZE if self.create_guide else None
+                    )
+                yield slide
+            
+            self.log_render_stats()
+            
+        except Exception as e:
+            self.log_event(f"Ошибка при конвертации PDF: {str(e)}", level='error')
+            raise
+        
+    def iter_deck_pages(self, pdf_path, last_page, skip=None):
+        """Пары (номер страницы, слайд) по всем страницам по порядку.
+        
+        Для страниц из skip слайд не рендерится, вместо него отдается None.
+        """
+        page_number = 1
+        for slide in self.convert_pdf_to_images(pdf_path, last_page=last_page, skip=skip):
+            while page_number < slide.slide_number:
+                yield page_number, None
+                page_number += 1
+            yield page_number, slide
+            page_number += 1
+        while page_number <= last_page:
+            yield page_number, None
+            page_number += 1
+
+    def scan_deck(self, pdf_path):
+        """Разбор презентации до рендеринга: (число страниц, текстовые страницы, pdf_preflight.Preflight).
+        
+        Порог классификатора текстовых слайдов фиксируется по превью всех
+        страниц. Без рендеринга пропускается только страница, которую считают
+        текстовой и текстовый слой, и пиксельная проверка ее превью: векторные
+        логотипы, таблицы цветов и образцы шрифтов без растровых изображений
+        по текстовому слою не отличить от страницы текста.
+        """
+        preflight = self.run_preflight(pdf_path)
+        if preflight is not None:
+            total_slides = preflight.page_count
+        else:
+            from slide_render import get_page_count
+            total_slides = get_page_count(pdf_path)
+        
+        self.text_classifier.reset()
+        previews = self.prime_text_classifier(pdf_path, total_slides)
+        text_pages = set()
+        if preflight is not None:
+            # Порог уже зафиксирован, поэтому без превью кандидаты просто рендерятся
+            candidates = sorted(preflight.text_pages) if previews else []
+            text_pages = {number for number in candidates if self.text_preview_check(pdf_path, number)}
+            self.log_event(
+                f"Без рендеринга пропускаются текстовые страницы: {len(text_pages)} "
+                f"из {len(preflight.text_pages)} кандидатов по текстовому слою, остальные рендерятся"
+            )
+        return total_slides, text_pages, preflight
+
+    def text_preview_check(self, pdf_path, page_number):
+        """Пиксельная проверка текстовой страницы по превью, достаточному для штрихов текста"""
+        from slide_classifier import PREVIEW_CHECK_SIDE
+        try:
+            with self.metrics.stage('preflight', slide=page_number):
+                preview = self.page_renderer.previews(
+                    pdf_path, page_number, page_number, side=PREVIEW_CHECK_SIDE
+                )[page_number]
+                return self.text_classifier.classify_images([preview])[0]
+        except Exception as e:
+            self.log_event(f"Превью страницы {page_number} недоступно, она будет отрендерена: {str(e)}",
+                           level='warning')
+            return False
+
+    def run_preflight(self, pdf_path):
+        """Предварительный разбор PDF до рендеринга (None, если отключен или утилиты недоступны)"""
+        if not self.preflight:
+            return None
+        from pdf_preflight import run_preflight
+        try:
+            with self.metrics.stage('preflight'):
+                preflight = run_preflight(pdf_path)
+        except Exception as e:
+            self.log_event(f"Предварительный разбор PDF недоступен, текстовые слайды определяются после рендеринга: {str(e)}",
+                           level='warning')
+            return None
+        self.log_event(f"Предварительный разбор: {preflight.summary()}")
+        return preflight
+
+    def prime_text_classifier(self, pdf_path, last_page):
+        """Фиксирует порог классификатора текстовых слайдов по превью всей презентации.
+        
+        Порог известен до первого решения, поэтому решение о слайде не зависит
+        от порядка обработки. Возвращает превью {номер: изображение}; если
+        превью недоступны, используется прежний порог для светлого фона.
+        """
+        try:
+            with self.metrics.stage('preflight'):
+                previews = self.page_renderer.previews(pdf_path, last_page=last_page)
+        except Exception as e:
+            self.log_event(f"Превью страниц недоступны, порог текстовых слайдов - для светлого фона: {str(e)}",
+                           level='warning')
+            previews = {}
+        self.text_classifier.prime(previews.values())
+        return previews
+
+    def log_render_stats(self):
+        """Логирует пропускную способность рендеринга"""
+        renderer = self.page_renderer
+        self.log_event(
+            f"Рендеринг: {renderer.pages_rendered} стр. за {renderer.render_seconds:.1f} сек "
+            f"({renderer.pages_per_second:.2f} стр/сек, процессов: {renderer.workers})"
+        )
+        
+    def create_chat_completion(self, **request_params):
+        """Синхронный запрос к chat.completions через движок и кеш ответов"""
+        return self.api_engine.create(**request_params)
+        
+    def log_cache_stats(self):
+        """Логирует статистику кеша ответов API"""
+        if self.response_cache is None:
+            return
+        stats = self.response_cache.stats()
+        self.log_event(
+            f"Кеш API: попаданий {stats['hits']}, промахов {stats['misses']} "
+            f"({stats['hit_rate']:.0%}), записей {stats['entries']}, "
+            f"{stats['size_bytes'] / (1024 * 1024):.1f} МБ"
+        )
+        
+    def log_rate_limit_stats(self):
+        """Логирует время ожидания лимитов API относительно времени работы запросов"""
+        stats = self.api_engine.rate_limiter.stats()
+        self.log_event(
+            f"Лимиты API: запросов {stats['requests']}, 429 - {stats['rate_limited']}, "
+            f"повторов {stats['retries']}; ожидание лимитов {stats['throttled_seconds']:.1f} сек, "
+            f"паузы перед повторами {stats['backoff_seconds']:.1f} сек, "
+            f"работа запросов {stats['working_seconds']:.1f} сек"
+        )
+        
+    def log_stage_times(self):
+        """Логирует время этапов конвейера"""
+        stages = ", ".join(f"{name} {seconds:.1f}" for name, seconds in self.metrics.summary().items())
+        self.log_event(f"Время этапов (сек): {stages}")
+        
+    def log_token_plan(self):
+        """Логирует итог плана детализации: оценка и факт входных токенов"""
+        planner = self.detail_planner
+        levels = {}
+        for record in planner.records.values():
+            levels[record['level']] = levels.get(record['level'], 0) + 1
+        budget = planner.token_budget or 'без ограничения'
+        self.log_event(
+            f"Токены изображений: оценка {planner.estimated_tokens}, "
+            f"факт ~{planner.actual_image_tokens} (prompt_tokens {planner.actual_tokens} "
+            f"минус текст промптов ~{planner.actual_tokens - planner.actual_image_tokens}), "
+            f"бюджет {budget}; "
+            f"уровни: {', '.join(f'{name}: {count}' for name, count in sorted(levels.items()))}"
+        )
+        
+    def initial_analysis(self, slides):
+        """Первичный анализ всей презентации.
+        
+        slides - любой итерируемый источник слайдов (например, потоковый
+        рендеринг). Каждый слайд освобождается сразу после отправки запроса,
+        поэтому в памяти остается не больше окна рендеринга.
+        """
+        self.update_status("Проводим первичный анализ презентации...")
+        
+        system_prompt = """Вы - опытный арт-директор и бренд-аналитик. Проведите первичный анализ слайда и верните результат в JSON формате.
+        Определите:
+        1. Категорию слайда (концепция/элемент системы/применение/вариант)
+        2. Если это вариант - к какой группе вариантов относится
+        3. Ключевые визуальные элементы
+        4. Связь с другими элементами системы"""
+        
+        from detail_planner import message_text_tokens
+        
+        initial_analysis = {}
+        
+        # Слайды независимы друг от друга, поэтому все запросы идут параллельно
+        # (или пакетными заданиями)
+        requests = []
+        with self.independent_requests() as submit:
+            for slide in slides:
+                with self.metrics.stage('classify', slide=slide.slide_number):
+                    is_text = self.is_text_slide(slide)
+                    if self.feature_hints and not is_text:
+                        self.feature_extractor.extract(slide)
+                if is_text:
+                    slide.release()
+                    continue
+                
+                plan = self.detail_planner.plan(slide)
+                messages = [
+                    {
+                        "role": "system",
+                        "content": system_prompt
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": "Проанализируйте этот слайд и предоставьте результат в JSON."
+                                        + self.feature_hint_text(slide)
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": slide.scaled(max(plan['size'])).data_url,
+                                    "detail": plan['detail']
+                                }
+                            }
+                        ]
+                    }
+                ]
+                future = submit(
+                    label='initial_analysis',
+                    slide=slide.slide_number,
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    max_tokens=500,
+                    response_format={ "type": "json_object" }
+                )
+                # Сообщения с изображением не храним: для учета токенов нужна только оценка текста
+                requests.append((slide.slide_number, future, message_text_tokens(messages)))
+                slide.release()
+        
+        for i, future, text_tokens in requests:
+            try:
+                response = future.result()
+                self.detail_planner.record_usage(i, response.usage, text_tokens)
+                analysis = json.loads(response.choices[0].message.content)
+                initial_analysis[i] = analysis
+                self.analysis_context['slides_map'][i] = analysis
+                self.update_status(f"Проанализирован слайд {i}")
+                
+            except Exception as e:
+                self.log_event(f"Ошибка при первичном анализе слайда {i}: {str(e)}")
+                
+        return initial_analysis
+
+    def build_smart_context(self, initial_analysis):
+        """Создание умного контекста на основе первичного анализа.
+
+        Анализы слайдов обобщаются порциями ограниченного размера, уровень
+        за уровнем (запросы одного уровня идут параллельно), пока данные не
+        поместятся в один финальный запрос (см. smart_context).
+        """
+        from smart_context import (
+            FINAL_OUTPUT_TOKENS, REDUCE_OUTPUT_TOKENS, chunk_items, part_digest,
+            reduce_messages, slide_digest
+        )
+        self.update_status("Формируем общее понимание дизайн-системы...")
+        
+        items = [slide_digest(i, analysis) for i, analysis in sorted(initial_analysis.items())]
+        if not items:
+            return {}
+        
+        chunks = chunk_items(items)
+        level = 0
+        while len(chunks) > 1:
+            level += 1
+            self.update_status(f"Обобщаем первичный анализ: уровень {level}, частей {len(chunks)}")
+            with self.independent_requests() as submit:
+                requests = [
+                    (chunk, submit(
+                        label='smart_context_reduce',
+                        model="gpt-4o-mini",
+                        messages=reduce_messages(chunk),
+                        max_tokens=REDUCE_OUTPUT_TOKENS,
+                        response_format={ "type": "json_object" }
+                    ))
+                    for chunk in chunks
+                ]
+            items = []
+            for chunk, future in requests:
+                try:
+                    summary = json.loads(future.result().choices[0].message.content)
+                except Exception as e:
+                    # Часть без обобщения идет дальше сжатыми исходными записями
+                    self.log_event(f"Ошибка при обобщении слайдов {chunk[0][0]}-{chunk[-1][1]}: {str(e)}")
+                    summary = None
+                items.append(part_digest(chunk, summary))
+            chunks = chunk_items(items)
+        
+        with self.independent_requests() as submit:
+            future = submit(
+                label='smart_context',
+                model="gpt-4o-mini",
+                messages=reduce_messages(chunks[0], final=True),
+                max_tokens=FINAL_OUTPUT_TOKENS,
+                response_format={ "type": "json_object" }
+            )
+        
+        try:
+            response = future.result()
+            return json.loads(response.choices[0].message.content)
+            
+        except Exception as e:
+            self.log_event(f"Ошибка при создании умного контекста: {str(e)}")
+            return {}
+
+    def analyze_slide_with_context(self, slide, slide_number, smart_context):
+        max_retries = 3
+        
+        if self.is_text_slide(slide):
+            self.log_event(f"Слайд {slide_number} пропущен (текстовый)")
+            return None
+        
+        for attempt in range(max_retries):
+            try:
+                context = self.user_context or "Анализ дизайна презентации"
+                
+                # Разрешение и detail изображения выбирает планировщик
+                plan = self.detail_planner.plan(slide)
+                with self.metrics.stage('resize', slide=slide_number):
+                    payload = slide.scaled(max(plan['size']))
+                    payload.jpeg_bytes
+                with self.metrics.stage('encode', slide=slide_number):
+                    image_url = payload.data_url
+                
+                # Ждем и применяем извлечения контекста с фиксированным отставанием
+                self.apply_context_updates(up_to=slide_number - CONTEXT_UPDATE_LAG - 1)
+                previous_context = self.get_brief_context()
+                context_tokens = count_tokens(previous_context)
+                self.metrics.record_context_tokens(slide_number, context_tokens)
+                
+                system_prompt = f"""Вы - опытный арт-директор, представляющий концепцию дизайна клиенту в неформальной обстановке. 
+                        Контекст проекта: {context}
+                        Что мы уже обсудили: {previous_context}"""
+                system_prompt += self.feature_hint_text(slide)
+                if self.context_mode == 'combined':
+                    system_prompt += """
+                        Верните JSON: в поле narration - ваш рассказ о слайде, в key_elements -
+                        ключевые элементы дизайна (название и описание), в design_decisions -
+                        дизайнерские решения, в connections - связи с другими элементами."""
+                
+                messages = [
+                    {
+                        "role": "system",
+                        "content": system_prompt
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": "Расскажите про это решение просто и по делу."
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": image_url,
+                                    "detail": plan['detail']
+                                }
+                            }
+                        ]
+                    }
+                ]
+                
+                # Повтор не должен получить из кеша тот же ответ, на котором попытка не удалась
+                refresh = attempt > 0
+                if self.context_mode == 'combined':
+                    # Рассказ и извлечение контекста за один запрос
+                    response = self.create_chat_completion(
+                        label='slide_analysis',
+                        slide=slide_number,
+                        refresh=refresh,
+                        model="gpt-4o-mini",
+                        messages=messages,
+                        max_tokens=900,
+                        response_format=SLIDE_ANALYSIS_RESPONSE_FORMAT,
+                        timeout=30
+                    )
+                    result = json.loads(response.choices[0].message.content)
+                    analysis = result['narration']
+                    self.add_comment(slide_number, analysis)
+                    self.merge_context_update(slide_number, analysis, {
+                        'key_elements': {item['name']: item['description'] for item in result['key_elements']},
+                        'design_decisions': result['design_decisions'],
+                        'connections': result['connections']
+                    })
+                else:
+                    response = self.create_chat_completion(
+                        label='slide_analysis',
+                        slide=slide_number,
+                        refresh=refresh,
+                        model="gpt-4o-mini",
+                        messages=messages,
+                        max_tokens=500,
+                        timeout=30  # Добавляем тайм-аут
+                    )
+                    
+                    analysis = response.choices[0].message.content
+                    
+                    self.update_presentation_context(slide_number, analysis)
+                
+                from detail_planner import message_text_tokens
+                text_tokens = message_text_tokens(messages)
+                self.detail_planner.record_usage(slide_number, response.usage, text_tokens)
+                self.log_event(
+                    f"Слайд {slide_number}: {plan['level']} {plan['size'][0]}x{plan['size'][1]}, "
+                    f"токенов изображения: оценка {plan['estimated_tokens']}, "
+                    f"факт ~{plan['actual_image_tokens']} (prompt_tokens {plan['actual_prompt_tokens']} "
+                    f"минус текст промпта ~{text_tokens}), "
+                    f"токенов контекста {context_tokens}"
+                )
+                self.log_event(f"Слайд {slide_number} успешно проанализирован")
+                return analysis
+                
+            except Exception as e:
+                self.log_event(f"Попытка {attempt + 1}/{max_retries} для слайда {slide_number} не удалась: {str(e)}", level='error')
+                if attempt < max_retries - 1:
+                    # Временные ошибки API повторяет движок; здесь - экспоненциальная
+                    # задержка со случайным разбросом вместо фиксированной паузы
+                    time.sleep(self.api_engine.rate_limiter.backoff_delay(attempt))
+                else:
+                    raise  # Пробрасываем ошибку после всех попыток
+
+    def analyze_slide_variant(self, slide, leader, leader_analysis):
+        """Анализ слайда-варианта: повтор анализа лидера группы или запрос только про отличия"""
+        # Полный анализ слайда стоит одного запроса в режиме 'combined' и двух в 'separate'
+        full_calls = 1 if self.context_mode == 'combined' else 2
+        
+        if self.dedup_mode != 'diff':
+            self.duplicate_index.calls_saved += full_calls
+            self.log_event(f"Слайд {slide.slide_number} - вариант слайда {leader}, анализ использован повторно")
+            return f"(вариант слайда {leader}) {leader_analysis}"
+        
+        response = self.create_chat_completion(
+            label='variant_diff',
+            slide=slide.slide_number,
+            model="gpt-4o-mini",
+            messages=[
+                {
+                    "role": "system",
+                    "content": f"""Вы - опытный арт-директор. Этот слайд - вариант уже обсужденного слайда {leader}.
+                    Что мы сказали о нем: {leader_analysis}
+                    Опишите одним-двумя предложениями только отличия этого варианта."""
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": slide.scaled(512).data_url,
+                                "detail": "low"
+                            }
+                        }
+                    ]
+                }
+            ],
+            max_tokens=150,
+            timeout=30
+        )
+        diff = response.choices[0].message.content
+        self.add_comment(slide.slide_number, diff)
+        self.duplicate_index.calls_saved += full_calls - 1
+        self.log_event(f"Слайд {slide.slide_number} - вариант слайда {leader}, описаны только отличия")
+        return f"(вариант слайда {leader}) {diff}"
+
+    def feature_hint_text(self, slide):
+        """Признаки слайда, измеренные по пикселям, как подсказка для промпта"""
+        if not self.feature_hints:
+            return ""
+        from slide_features import format_hints
+        return f"\nИзмерено по пикселям слайда: {format_hints(self.feature_extractor.extract(slide))}."
+
+    def get_brief_context(self):
+        """Формирует краткий контекст из предыдущих слайдов в пределах бюджета токенов"""
+        return self.presentation_context.brief()
+
+    def update_presentation_context(self, slide_number, analysis):
+        """Обновляет контекст презентации на основе нового анализа.
+        
+        Комментарий сохраняется сразу, а извлечение ключевой информации
+        уходит в API в фоне и применяется позже в apply_context_updates.
+        """
+        # Сохраняем комментарий
+        self.add_comment(slide_number, analysis)
+        self.submit_context_extraction(slide_number, analysis)
+
+    def add_comment(self, slide_number, comment):
+        """Добавляет комментарий к слайду в контекст презентации"""
+        self.presentation_context.add_comment(slide_number, comment)
+        self.context_events.append({'type': 'comment', 'slide': slide_number, 'comment': comment})
+        if self.journal:
+            self.journal.record_comment(slide_number, comment)
+
+    def submit_context_extraction(self, slide_number, analysis):
+        """Отправляет в фоне запрос на извлечение ключевой информации из комментария"""
+        try:
+            # Анализируем комментарий для извлечения ключевой информации
+            context_update_prompt = f"""
+            Проанализируйте этот комментарий к слайду {slide_number} и верните строго валидный JSON с такой структурой:
+            {{
+                "key_elements": {{"element_name": "description"}},
+                "design_decisions": ["decision1", "decision2"],
+                "connections": ["connection1", "connection2"]
+            }}
+
+            Комментарий для анализа:
+            {analysis}
+            """
+            
+            future = self.api_engine.submit(
+                label='context_extraction',
+                slide=slide_number,
+                model="gpt-4o-mini",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Вы - парсер, который создает только валидный JSON. Всегда проверяйте закрытие кавычек и скобок."
+                    },
+                    {
+                        "role": "user",
+                        "content": context_update_prompt
+                    }
+                ],
+                max_tokens=500,
+                response_format={ "type": "json_object" }
+            )
+            self.pending_context_updates.append((slide_number, analysis, future))
+            
+        except Exception as e:
+            self.log_event(f"Ошибка при обновлении контекста: {str(e)}", level='error')
+
+    def apply_context_updates(self, up_to=None):
+        """Применяет результаты извлечения контекста строго в порядке слайдов.
+        
+        Дожидается и применяет извлечения слайдов с номером не больше up_to
+        (все - если up_to не задан). Более новые не применяются, даже если уже
+        готовы, чтобы контекст не зависел от времени ответов.
+        """
+        while self.pending_context_updates:
+            slide_number, analysis, future = self.pending_context_updates[0]
+            if up_to is not None and slide_number > up_to:
+                break
+            self.pending_context_updates.popleft()
+            
+            try:
+                response = future.result()
+                update_info = json.loads(response.choices[0].message.content)
+                self.merge_context_update(slide_number, analysis, update_info)
+                
+            except json.JSONDecodeError as e:
+                self.log_event(f"Ошибка парсинга JSON при обновлении контекста: {str(e)}", level='warning')
+            except Exception as e:
+                self.log_event(f"Ошибка при обновлении контекста: {str(e)}", level='error')
+
+    def merge_context_update(self, slide_number, analysis, update_info):
+        """Добавляет извлеченные ключевые элементы и решения в контекст презентации"""
+        if self.journal:
+            self.journal.record_merge(slide_number, analysis, update_info)
+        self.context_events.append({
+            'type': 'merge', 'slide': slide_number, 'analysis': analysis, 'update_info': update_info
+        })
+        
+        # Элементы объединяются с уже известными, лишние вытесняются по рангу
+        self.presentation_context.merge(slide_number, update_info)
+
+    def is_text_slide(self, slide):
+        try:
+            return self.text_classifier.is_text(slide)
+        except Exception as e:
+            self.log_event(f"Ошибка при анализе текстового слайда: {str(e)}", level='error')
+            return False
+
+    def save_analysis_report(self, content, pdf_path):
+        """Сохраняет отчет рядом с исходным PDF (или в output_dir)"""
+        try:
+            # Получаем путь и имя исходного файла
+            pdf_dir = self.output_dir or os.path.dirname(pdf_path)
+            pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+            
+            # Формируем имя файла отчета
+            timestamp = time.strftime("%Y%m%d-%H%M%S")
+            report_name = f"{pdf_name}_analysis_{timestamp}.txt"
+            report_path = os.path.join(pdf_dir, report_name)
+            
+            # Добавляем информацию о контексте анализа
+            context = self.user_context or "Стандартный анализ дизайна презентации"
+            
+            header = f"""АНАЛИЗ ПРЕЗЕНТАЦИИ: {pdf_name}
+Дата анализа: {time.strftime("%Y-%m-%d %H:%M:%S")}
+
+КОНТЕКСТ АНАЛИЗА:
+{context}
+
+💡 ПОДСКАЗКА ДЛЯ ПРЕЗЕНТАЦИИ:
+- Текст структурирован для удобного чтения
+- **Жирным** выделены ключевые слова
+- Каждый слайд содержит главную мысль и детали
+- Используйте • ГЛАВНОЕ как опорную точку
+- В • ДЕТАЛИ собраны аргументы для обсуждения
+- • СВЯЗЬ поможет создать плавный переход
+
+РЕЗУЛЬТАТЫ АНАЛИЗА:
+=================
+
+"""
+            
+            # Сохраняем отчет
+            with open(report_path, 'w', encoding='utf-8') as f:
+                f.write(header + content)
+            
+            self.log_event(f"\nОтчет сохранен: {report_path}")
+            return report_path
+            
+        except Exception as e:
+            self.log_event(f"\nОшибка при сохранении отчета: {str(e)}")
+            return None
+
+    def analyze_pdf(self, pdf_path, context=None):
+        """Полный анализ презентации.
+        
+        Возвращает словарь с результатами по слайдам и путями к отчету и гайду.
+        Ошибки уровня всей презентации пробрасываются вызывающему коду.
+        """
+        self.user_context = context
+        self.reset_contexts()
+        self.metrics.reset()
+        self.start_time = time.time()
+        report_path = None
+        guide_path = None
+        changes_path = None
+        
+        try:
+            self.log_event(f"Анализируемый файл: {pdf_path}")
+            
+            # Число страниц и текстовые страницы известны до рендеринга
+            total_slides, text_pages, preflight = self.scan_deck(pdf_path)
+            self.log_event(f"В презентации {total_slides} слайдов")
+            self.detail_planner.start_deck(total_slides - len(text_pages))
+            self.feature_extractor.reset()
+            self.duplicate_index.reset()
+            
+            analysis_results = []  # Сохраняем результаты анализа
+            analyses = {}  # Анализ по номеру слайда (для повторного использования в вариантах)
+            
+            # Журнал запуска: продолжаем с первого незавершенного слайда
+            finished = self.open_journal(pdf_path, total_slides)
+            
+            # Прошлая версия презентации: неизмененные слайды не анализируются заново
+            history = self.open_deck_history(pdf_path) if self.incremental else None
+            reuse = history is not None and history.usable(self.analysis_settings())
+            version_pages = {}
+            
+            # Гайд собирается по мере готовности слайдов
+            guide = self.start_presentation_guide(pdf_path) if self.create_guide else None
+            
+            # Слайды рендерятся потоково и анализируются сразу по готовности
+            self.update_status("Конвертируем PDF в изображения...")
+            for i, slide in self.iter_deck_pages(pdf_path, total_slides, skip=text_pages):
+                if self.stop_requested.is_set():
+                    if slide is not None:
+                        slide.release()
+                    break
+                try:
+                    fingerprint = None
+                    if slide is None:
+                        # Текстовая страница по данным предварительного разбора (не рендерилась)
+                        is_text, leader, features = True, None, None
+                        if history is not None:
+                            fingerprint = {'sha256': preflight.pages[i]['text_digest'], 'dhash': 0}
+                    else:
+                        with self.metrics.stage('classify', slide=i):
+                            is_text = self.is_text_slide(slide)
+                            leader = None
+                            if self.dedup_mode != 'off' and not is_text:
+                                leader = self.duplicate_index.match(slide)
+                            # Признаки считаются сейчас, пока пиксели слайда в памяти
+                            features = self.feature_extractor.extract(slide) if self.feature_hints and not is_text else None
+                            if history is not None:
+                                from deck_versions import page_fingerprint
+                                fingerprint = page_fingerprint(slide)
+                    previous = history.claim(fingerprint) if reuse and i not in finished else None
+                    
+                    if i in finished:
+                        # Слайд завершен в прерванном запуске: берем результат из журнала
+                        analysis = finished[i]['analysis']
+                        status = finished[i]['status']
+                    elif previous is not None:
+                        # Слайд не изменился с прошлой версии
+                        status = previous[1]['status']
+                        analysis = self.reuse_slide(i, *previous)
+                    elif slide is None:
+                        self.log_event(f"Слайд {i} пропущен (текстовый, без рендеринга)")
+                        status, analysis = 'text', None
+                        self.record_finished_slide(i, status, analysis, is_text)
+                    elif leader in analyses:
+                        self.log_event(f"Начинаем анализ слайда {i}")
+                        with self.metrics.stage('analyze', slide=i):
+                            analysis = self.analyze_slide_variant(slide, leader, analyses[leader])
+                        status = 'variant'
+                        self.record_finished_slide(i, status, analysis)
+                    else:
+                        self.log_event(f"Начинаем анализ слайда {i}")
+                        with self.metrics.stage('analyze', slide=i):
+                            analysis = self.analyze_slide_with_context(slide, i, None)
+                        status = 'text' if is_text else 'analyzed'
+                        self.record_finished_slide(i, status, analysis, is_text)
+                    if history is not None:
+                        version_pages[i] = {
+                            'fingerprint': fingerprint, 'status': status, 'analysis': analysis, 'is_text': is_text
+                        }
+                    if analysis:
+                        self.emit_result(f"• Слайд {i}: {analysis}")
+                        analysis_results.append((i, analysis))
+                        analyses[i] = analysis
+                        if guide:
+                            thumbnail = slide.thumbnail if slide is not None else None
+                            self.add_guide_slide(guide, i, analysis, thumbnail, features)
+                except Exception as e:
+                    self.emit_result(f"• Слайд {i}: Ошибка при анализе слайда {i}: {str(e)}")
+                if slide is not None:
+                    slide.release()
+                if i not in finished:
+                    self.metrics.slide_finished()
+                
+                # Обновляем прогресс, скорость и оставшееся время
+                progress = (i / total_slides) * 100
+                self.report_progress(progress)
+                status = f"Проанализировано {i} из {total_slides} слайдов ({progress:.1f}%)"
+                processed = self.metrics.slides_done
+                if processed:
+                    status += (
+                        f", {self.metrics.throughput():.2f} слайдов/сек, "
+                        f"осталось ~{self.estimate_time_left(processed, processed + total_slides - i)}"
+                    )
+                self.update_status(status)
+            
+            if self.stop_requested.is_set():
+                # Журнал не помечается завершенным: следующий запуск продолжит с этого места
+                self.log_event("Анализ остановлен", level='warning')
+                self.update_status("Анализ остановлен")
+                return {
+                    'results': analysis_results,
+                    'slides': total_slides,
+                    'report_path': None,
+                    'guide_path': None,
+                    'changes_path': None
+                }
+            
+            # Дожидаемся оставшихся извлечений контекста
+            with self.metrics.stage('analyze'):
+                self.apply_context_updates()
+            
+            # Создаем итоговый отчет
+            if analysis_results:
+                self.update_status("Создаем итоговый отчет...")
+                
+                # Сохраняем текстовый отчет
+                report_content = "\n".join([f"Слайд {i}: {analysis}" for i, analysis in analysis_results])
+                dedup_summary = self.duplicate_index.summary()
+                if dedup_summary:
+                    self.log_event(dedup_summary)
+                with self.metrics.stage('report'):
+                    report_path = self.save_analysis_report(
+                        report_content + (f"\n\n{dedup_summary}" if dedup_summary else ""),
+                        pdf_path
+                    )
+                
+                # Верстаем презентационный гайд из уже подготовленных страниц
+                if guide:
+                    try:
+                        with self.metrics.stage('guide'):
+                            guide_path = guide.build()
+                        self.log_event(f"\nПрезентационный гайд сохранен: {guide_path}")
+                    except Exception as e:
+                        self.log_event(f"\nОшибка при создании презентационного гайда: {str(e)}", level='error')
+            
+            if history is not None:
+                changes_path = self.save_deck_version(history, pdf_path, version_pages)
+            
+            if self.journal:
+                self.journal.complete()
+            
+            self.log_cache_stats()
+            self.log_rate_limit_stats()
+            self.log_token_plan()
+            self.log_stage_times()
+            self.update_status("Анализ завершен")
+            
+        except Exception as e:
+            self.log_event(f"Ошибка при анализе: {str(e)}", level='error')
+            raise
+        finally:
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+            self.save_metrics(pdf_path)
+        
+        return {
+            'results': analysis_results,
+            'slides': total_slides,
+            'report_path': report_path,
+            'guide_path': guide_path,
+            'changes_path': changes_path
+        }
+
+    def save_metrics(self, pdf_path):
+        """Выгружает метрики запуска в JSON и в формате Prometheus"""
+        if not METRICS_ENABLED:
+            return None
+        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        try:
+            json_path, prom_path = self.metrics.save(
+                f"{pdf_name}_metrics_{time.strftime('%Y%m%d-%H%M%S')}",
+                deck=pdf_name,
+                context_mode=self.context_mode,
+                dedup_mode=self.dedup_mode
+            )
+            self.log_event(f"Метрики запуска сохранены: {json_path}, {prom_path}")
+            return json_path
+        except Exception as e:
+            self.log_event(f"Ошибка при сохранении метрик: {str(e)}", level='warning')
+            return None
+
+    def open_journal(self, pdf_path, total_slides):
+        """Открывает журнал запуска и восстанавливает состояние прерванного анализа.
+        
+        Возвращает завершенные ранее слайды {номер: запись журнала}. Контекст
+        презентации восстанавливается повтором событий в исходном порядке.
+        """
+        try:
+            journal = open_run_journal(pdf_path, self.user_context, self.pipeline_settings())
+        except Exception as e:
+            self.log_event(f"Журнал запуска недоступен: {str(e)}", level='warning')
+            return {}
+        if journal is None:
+            return {}
+        
+        journal.load()
+        resume = journal.can_resume(total_slides)
+        if resume:
+            # Повторяем изменения контекста в исходном порядке (журнал еще не открыт
+            # на запись, поэтому события в него не дублируются)
+            self.replay_context_events(journal.context_events)
+            
+            # Извлечения контекста, не успевшие завершиться до сбоя, запускаем заново
+            if self.context_mode == 'separate':
+                merged = {event['slide'] for event in journal.context_events if event['type'] == 'merge'}
+                for slide_number, event in sorted(journal.slides.items()):
+                    if event['status'] == 'analyzed' and slide_number not in merged:
+                        self.submit_context_extraction(slide_number, event['analysis'])
+            
+            self.log_event(
+                f"Продолжаем прерванный анализ: завершено {len(journal.slides)} из {total_slides} слайдов, "
+                f"первый незавершенный - {journal.first_unfinished(total_slides)}"
+            )
+        
+        journal.start(total_slides, resume)
+        self.journal = journal
+        return dict(journal.slides) if resume else {}
+
+    def replay_context_events(self, events, slide_number=None):
+        """Применяет сохраненные события контекста (comment/merge).
+        
+        С slide_number события относятся к этому слайду (номер слайда в новой версии).
+        """
+        for event in events:
+            number = slide_number if slide_number is not None else event['slide']
+            if event['type'] == 'comment':
+                self.add_comment(number, event['comment'])
+            else:
+                self.merge_context_update(number, event['analysis'], event['update_info'])
+
+    def pipeline_settings(self):
+        """Настройки конвейера, влияющие на результат (ключ журнала запуска и версий)"""
+        from pdf_preflight import TEXT_ONLY_CHARS
+        return {
+            'context_mode': self.context_mode,
+            'dedup_mode': self.dedup_mode,
+            'feature_hints': self.feature_hints,
+            'preflight': self.preflight,
+            'text_only_chars': TEXT_ONLY_CHARS if self.preflight else None
+        }
+
+    def analysis_settings(self):
+        """Настройки, при которых результаты прошлой версии можно использовать повторно"""
+        return dict(self.pipeline_settings(), context=self.user_context)
+
+    def open_deck_history(self, pdf_path):
+        """История прошлой версии презентации (None при ошибке чтения)"""
+        from deck_versions import DeckHistory
+        try:
+            history = DeckHistory.for_pdf(pdf_path)
+        except Exception as e:
+            self.log_event(f"История версий недоступна: {str(e)}", level='warning')
+            return None
+        if not history.pages:
+            self.log_event("Прошлых версий презентации нет, анализируем полностью")
+        elif history.usable(self.analysis_settings()):
+            self.log_event(f"Найдена прошлая версия презентации: {history.pdf_name} ({len(history.pages)} слайдов)")
+        else:
+            self.log_event(
+                f"Прошлая версия {history.pdf_name} проанализирована с другими настройками, "
+                f"результаты не используются"
+            )
+        return history
+
+    def reuse_slide(self, slide_number, previous_number, page):
+        """Берет результат неизмененного слайда из прошлой версии и восстанавливает его вклад в контекст"""
+        self.replay_context_events(page.get('events', []), slide_number)
+        self.record_finished_slide(slide_number, page['status'], page['analysis'], page.get('is_text', False))
+        moved = f" (был слайд {previous_number})" if previous_number != slide_number else ""
+        self.log_event(f"Слайд {slide_number} не изменился{moved}, анализ взят из прошлой версии")
+        return page['analysis']
+
+    def save_deck_version(self, history, pdf_path, pages):
+        """Сохраняет результаты этой версии и отчет об изменениях относительно прошлой.
+        
+        pages - {номер: {'fingerprint', 'status', 'analysis', 'is_text'}}.
+        Возвращает путь к отчету об изменениях (None, если прошлой версии нет).
+        """
+        from deck_versions import format_diff, match_pages
+        
+        pdf_name = os.path.basename(pdf_path)
+        changes_path = None
+        try:
+            if history.pages:
+                matches = match_pages(history.fingerprints(), {i: page['fingerprint'] for i, page in pages.items()})
+                self.log_event(
+                    f"Изменения относительно {history.pdf_name}: без изменений {len(matches['unchanged'])}, "
+                    f"изменено {len(matches['changed'])}, новых {len(matches['new'])}, "
+                    f"удалено {len(matches['removed'])}"
+                )
+                pdf_dir = self.output_dir or os.path.dirname(pdf_path)
+                changes_path = os.path.join(
+                    pdf_dir,
+                    f"{os.path.splitext(pdf_name)[0]}_changes_{time.strftime('%Y%m%d-%H%M%S')}.txt"
+                )
+                with open(changes_path, 'w', encoding='utf-8') as f:
+                    f.write(format_diff(matches, history.pdf_name, pdf_name))
+                self.log_event(f"Отчет об изменениях сохранен: {changes_path}")
+            
+            events = {}
+            for event in self.context_events:
+                events.setdefault(event['slide'], []).append(event)
+            for slide_number, page in pages.items():
+                page['events'] = events.get(slide_number, [])
+            history.save(pdf_name, self.analysis_settings(), pages)
+        except Exception as e:
+            self.log_event(f"Ошибка при сохранении версии презентации: {str(e)}", level='warning')
+        return changes_path
+
+    def record_finished_slide(self, slide_number, status, analysis, is_text=False):
+        """Записывает завершенный слайд в журнал запуска"""
+        if self.journal:
+            self.journal.record_slide(slide_number, status, analysis, is_text)
+
+    def estimate_time_left(self, current, total):
+        if current == 0:
+            return "..."
+        
+        elapsed_time = time.time() - self.start_time
+        time_per_slide = elapsed_time / current
+        remaining_slides = total - current
+        remaining_time = remaining_slides * time_per_slide
+        
+        if remaining_time < 60:
+            return f"{int(remaining_time)} сек"
+        else:
+            return f"{int(remaining_time / 60)} мин {int(remaining_time % 60)} сек"
+
+    def start_presentation_guide(self, pdf_path):
+        """Создает сборщик презентационного гайда (рядом с PDF или в output_dir)"""
+        from presentation_guide import GuideBuilder
+        
+        pdf_dir = self.output_dir or os.path.dirname(pdf_path)
+        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        guide_path = os.path.join(pdf_dir, f"{pdf_name}_presentation_guide.pdf")
+        return GuideBuilder(guide_path, f"Презентационный гайд: {pdf_name}")
+
+    def add_guide_slide(self, guide, slide_number, analysis, thumbnail, features=None):
+        """Добавляет готовый слайд в гайд; ошибка гайда не прерывает анализ"""
+        try:
+            with self.metrics.stage('guide', slide=slide_number):
+                guide.add_slide(slide_number, analysis, thumbnail, features)
+        except Exception as e:
+            self.log_event(f"Ошибка при добавлении слайда {slide_number} в гайд: {str(e)}", level='warning')
+
+    def batch_analyze_pdf(self, pdf_path, context=None):
+        """Офлайн-анализ презентации: первичный анализ слайдов и контекст дизайн-системы.
+        
+        С batch_transport все независимые запросы уходят пакетными заданиями
+        (первичный анализ - одним заданием, обобщение - заданием на уровень).
+        Результаты попадают в analysis_context и сохраняются в JSON.
+        """
+        self.user_context = context
+        self.reset_contexts()
+        self.metrics.reset()
+        self.start_time = time.time()
+        results_path = None
+        
+        try:
+            self.log_event(f"Анализируемый файл: {pdf_path}")
+            
+            total_slides, text_pages, _ = self.scan_deck(pdf_path)
+            self.detail_planner.start_deck(total_slides - len(text_pages))
+            self.feature_extractor.reset()
+            
+            # Текстовые страницы в первичный анализ не попадают, поэтому не рендерятся.
+            # Слайды идут потоком: каждый освобождается сразу после отправки запроса
+            self.update_status("Конвертируем PDF в изображения...")
+            slides = self.convert_pdf_to_images(pdf_path, last_page=total_slides, skip=text_pages)
+            
+            with self.metrics.stage('analyze'):
+                initial_analysis = self.initial_analysis(slides)
+                self.analysis_context['design_systems'] = self.build_smart_context(initial_analysis)
+            
+            with self.metrics.stage('report'):
+                results_path = self.save_batch_results(pdf_path)
+            self.log_token_plan()
+            self.log_stage_times()
+            self.update_status("Анализ завершен")
+            
+        except Exception as e:
+            self.log_event(f"Ошибка при анализе: {str(e)}", level='error')
+            raise
+        finally:
+            self.save_metrics(pdf_path)
+        
+        return {
+            'initial_analysis': self.analysis_context['slides_map'],
+            'smart_context': self.analysis_context['design_systems'],
+            'results_path': results_path
+        }
+
+    def save_batch_results(self, pdf_path):
+        """Сохраняет analysis_context офлайн-анализа в JSON рядом с исходным PDF (или в output_dir)"""
+        pdf_dir = self.output_dir or os.path.dirname(pdf_path)
+        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        results_path = os.path.join(pdf_dir, f"{pdf_name}_context_{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(results_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'pdf': pdf_path,
+                'context': self.user_context,
+                'analysis_context': self.analysis_context,
+            }, f, ensure_ascii=False, indent=2)
+        self.log_event(f"\nКонтекст презентации сохранен: {results_path}")
+        return results_path
+
+    def test_analyze(self, pdf_path, slide_count=10):
+        """Тестовый анализ первых slide_count слайдов"""
+        self.log_event(f"Начинаем тестовый анализ первых {slide_count} слайдов")
+        results = []
+        
+        try:
+            self.log_event(f"Анализируемый файл: {pdf_path}")
+            
+            # Конвертируем только первые слайды
+            from slide_image import SlideImage
+            from slide_render import get_page_count
+            last_page = min(slide_count, get_page_count(pdf_path))
+            slides = []
+            for i, image in self.page_renderer.iter_pages(pdf_path, last_page=last_page):
+                slides.append(SlideImage.from_render(i, image))
+                self.log_event(f"Подготовлен слайд {i}")
+            self.log_render_stats()
+            
+            # Слайды независимы, поэтому все запросы отправляются параллельно
+            # (параллельность ограничивает движок API) или одним пакетным заданием
+            requests = []
+            with self.independent_requests() as submit:
+                for slide in slides:
+                    future = submit(
+                        label='test_analysis',
+                        slide=slide.slide_number,
+                        model="gpt-4o-mini",
+                        messages=[
+                            {
+                                "role": "user",
+                                "content": [
+                                    {
+                                        "type": "text",
+                                        "text": "Опишите, что вы видите на этом слайде презентации?"
+                                    },
+                                    {
+                                        "type": "image_url",
+                                        "image_url": {
+                                            "url": slide.data_url
+                                        }
+                                    }
+                                ]
+                            }
+                        ],
+                        max_tokens=300
+                    )
+                    requests.append((slide.slide_number, future))
+            
+            # Выводим результаты в порядке слайдов
+            for i, future in requests:
+                self.log_event(f"\n=== Анализ слайда {i} ===")
+                try:
+                    analysis = future.result().choices[0].message.content
+                    self.log_event(f"\nРезультат анализа слайда {i}:")
+                    self.log_event(analysis)
+                    results.append((i, analysis))
+                    
+                except Exception as e:
+                    self.log_event(f"Ошибка при анализе слайда {i}: {str(e)}", level='error')
+            
+            self.log_event("\nТестовый анализ завершен")
+            self.log_cache_stats()
+            self.log_rate_limit_stats()
+            
+        except Exception as e:
+            self.log_event(f"Общая ошибка тестового анализа: {str(e)}", level='error')
+        
+        return results
+
+
+def cli_main(argv=None):
+    """Точка входа командной строки: анализ PDF без графического интерфейса"""
+    parser = argparse.ArgumentParser(
+        description="Brand Design Analyzer Pro: анализ PDF-презентации без графического интерфейса"
+    )
+    parser.add_argument('pdf', help="путь к PDF-файлу презентации")
+    parser.add_argument('--context', default=None, help="контекст анализа (о проекте, цели, аудитории)")
+    parser.add_argument('--context-file', default=None, help="файл с контекстом анализа")
+    parser.add_argument('--output-dir', default=None, help="папка для отчета и гайда (по умолчанию рядом с PDF)")
+    parser.add_argument('--test', action='store_true', help="тестовый анализ первых 10 слайдов")
+    parser.add_argument('--no-guide', action='store_true', help="не создавать презентационный гайд")
+    parser.add_argument('--quiet', action='store_true', help="не выводить результаты по слайдам")
+    parser.add_argument('--base-url', default=None,
+                        help="адрес совместимого с OpenAI API (например, локального fake_openai_server)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="анализировать заново только слайды, изменившиеся с прошлой версии презентации")
+    parser.add_argument('--batch', action='store_true',
+                        help="офлайн-режим: первичный анализ и контекст дизайн-системы через Batch API")
+    parser.add_argument('--batch-local', default=None, metavar='DIR',
+                        help="офлайн-режим с файловой заменой Batch API в папке DIR (без сети)")
+    args = parser.parse_args(argv)
+    
+    context = args.context
+    if args.context_file:
+        with open(args.context_file, encoding='utf-8') as f:
+            context = f.read().strip()
+    
+    if args.output_dir and not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    
+    logger = setup_logging()
+    try:
+        batch_transport = None
+        if args.batch_local:
+            from batch_jobs import LocalBatchTransport
+            batch_transport = LocalBatchTransport(args.batch_local)
+        elif args.batch:
+            from batch_jobs import OpenAIBatchTransport
+            batch_transport = OpenAIBatchTransport(base_url=args.base_url)
+        analyzer = BrandAnalyzer(
+            output_dir=args.output_dir,
+            create_guide=not args.no_guide,
+            on_result=None if args.quiet else print,
+            logger=logger,
+            base_url=args.base_url,
+            batch_transport=batch_transport
+        )
+        if args.incremental:
+            analyzer.incremental = True
+    except Exception as e:
+        print(f"Ошибка при запуске анализа: {str(e)}", file=sys.stderr)
+        return 2
+    
+    try:
+        if args.test:
+            analyzer.test_analyze(args.pdf)
+        elif batch_transport is not None:
+            analyzer.batch_analyze_pdf(args.pdf, context)
+        else:
+            analyzer.analyze_pdf(args.pdf, context)
+        return 0
+    except Exception as e:
+        print(f"Ошибка при анализе: {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        analyzer.close()
+
+
+if __name__ == "__main__":
+    sys.exit(cli_main())
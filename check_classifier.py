@@ -0,0 +1,126 @@
+"""Проверка классификации текстовых слайдов на синтетической презентации.
+
+Презентация: текстовый слайд на белом, текстовый слайд на темно-синем,
+логотип на темно-синем, иллюстрация из крупных фигур и пастельные образцы
+цветов. Проверяется, что:
+- текстовыми признаны ровно текстовые слайды (визуальные не пропускаются),
+  в том числе в светлой презентации без темных слайдов, где порог контраста
+  по гистограмме минимален;
+- решения и доли чернил не зависят от порядка слайдов: слайды
+  классифицируются по одному во всех порядках, как при потоковом анализе,
+  а порог фиксируется prime() по всей презентации заранее.
+
+    python check_classifier.py
+"""
+import itertools
+import sys
+
+from PIL import Image as PILImage, ImageDraw, ImageFont
+
+from slide_classifier import TextSlideClassifier
+from slide_image import SlideImage
+
+SLIDE_SIZE = (2000, 1125)
+NAVY = (16, 32, 80)
+WORDS = ("Бренд-платформа определяет тон голоса, визуальный язык и правила "
+         "применения логотипа на всех носителях компании").split()
+
+
+def text_slide(background='white', color=(30, 30, 30), font_size=34):
+    image = PILImage.new('RGB', SLIDE_SIZE, background)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=font_size)
+    top, row = 60, 0
+    while top < SLIDE_SIZE[1] - 60:
+        line = " ".join(WORDS[(row * 3 + index) % len(WORDS)] for index in range(12))
+        draw.text((80, top), line, font=font, fill=color)
+        top += int(font_size * 1.25)
+        row += 1
+    return image
+
+
+def navy_text_slide():
+    return text_slide(NAVY, (240, 240, 240))
+
+
+def navy_logo_slide():
+    image = PILImage.new('RGB', SLIDE_SIZE, NAVY)
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((810, 370, 1190, 750), fill='white')
+    draw.rectangle((700, 820, 1300, 870), fill=(230, 180, 40))
+    return image
+
+
+def illustration_slide():
+    image = PILImage.new('RGB', SLIDE_SIZE, 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((250, 190, 1120, 940), fill=(200, 60, 40))
+    draw.ellipse((1250, 380, 1750, 880), fill=(40, 120, 200))
+    return image
+
+
+def pastel_swatches_slide():
+    image = PILImage.new('RGB', SLIDE_SIZE, 'white')
+    draw = ImageDraw.Draw(image)
+    colors = [(250, 200, 200), (200, 230, 250), (220, 250, 210), (250, 240, 190)]
+    for index, color in enumerate(colors):
+        draw.rectangle((100 + index * 460, 200, 500 + index * 460, 800), fill=color)
+    return image
+
+
+# Слайд и ожидаемое решение "текстовый"
+DECK = (
+    (text_slide, True),
+    (navy_text_slide, True),
+    (navy_logo_slide, False),
+    (illustration_slide, False),
+    (pastel_swatches_slide, False),
+)
+
+
+def classify_in_order(images, order):
+    """Классифицирует слайды по одному в заданном порядке: {номер: (флаг, доля чернил)}"""
+    classifier = TextSlideClassifier()
+    classifier.prime(images)
+    for index in order:
+        classifier.is_text(SlideImage(index + 1, image=images[index]))
+    return {number: (classifier.results[number], round(classifier.ratios[number], 6))
+            for number in sorted(classifier.results)}
+
+
+def check_decisions(deck, images, name):
+    """Сравнивает решения с ожидаемыми; возвращает True при расхождении"""
+    result = classify_in_order(images, range(len(images)))
+    failed = False
+    for number, (make, is_text) in enumerate(deck, 1):
+        if result[number][0] != is_text:
+            failed = True
+            print(f"{name}, {make.__name__}: текстовый={result[number][0]} "
+                  f"(доля чернил {result[number][1]}), ожидалось {is_text}")
+    return failed
+
+
+def main():
+    images = [make() for make, _ in DECK]
+    failed = check_decisions(DECK, images, "Вся презентация")
+    light = [index for index, image in enumerate(images) if image.getpixel((0, 0)) != NAVY]
+    failed |= check_decisions([DECK[index] for index in light], [images[index] for index in light],
+                              "Светлая презентация")
+
+    orders = list(itertools.permutations(range(len(images))))
+    expected = classify_in_order(images, orders[0])
+
+    for order in orders[1:]:
+        result = classify_in_order(images, order)
+        if result != expected:
+            failed = True
+            print(f"Порядок {[index + 1 for index in order]}: {result} вместо {expected}")
+            break
+
+    if not failed:
+        print(f"Классификация верна и не зависит от порядка слайдов ({len(orders)} порядков): {expected}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Проверка времени холодного запуска и отсутствия тяжелых импортов при старте.
+
+Каждый сценарий запускается в новом процессе несколько раз, берется медиана:
+- gui:    импорт pdf_brand_analyzer и создание движка анализа (без окна Tk);
+- cli:    python pdf_brand_analyzer.py --help (разбор аргументов CLI).
+
+Дополнительно проверяется, что после создания движка не загружены
+openai, numpy, PIL, pdf2image и reportlab: они нужны только этапам анализа.
+
+    python check_startup.py --runs 5 --target 0.5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTUP_TARGET = float(os.getenv('BRAND_ANALYZER_STARTUP_TARGET', '0.5'))
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ('openai', 'numpy', 'PIL', 'pdf2image', 'reportlab')
+
+GUI_READY = (
+    "import pdf_brand_analyzer, brand_engine; "
+    "brand_engine.BrandAnalyzer(api_key='startup-check')"
+)
+HEAVY_CHECK = GUI_READY + "; import sys; print(','.join(m for m in {modules!r} if m in sys.modules))"
+
+
+def run_python(args, work_dir):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, BRAND_ANALYZER_CACHE='0')
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, cwd=work_dir, env=env,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} завершился с кодом {result.returncode}:\n{result.stderr}")
+    return elapsed, result.stdout
+
+
+def measure(args, runs, work_dir):
+    """Медиана времени запуска процесса, секунды"""
+    return statistics.median(run_python(args, work_dir)[0] for _ in range(runs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка времени запуска приложения")
+    parser.add_argument('--runs', type=int, default=5, help="запусков на сценарий")
+    parser.add_argument('--target', type=float, default=STARTUP_TARGET, help="допустимое время запуска, сек")
+    args = parser.parse_args(argv)
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix='brand_startup_') as work_dir:
+        baseline = measure(['-c', 'pass'], args.runs, work_dir)
+        scenarios = {
+            'gui': ['-c', GUI_READY],
+            'cli': [os.path.join(REPO_DIR, 'pdf_brand_analyzer.py'), '--help'],
+        }
+        for name, scenario in scenarios.items():
+            seconds = measure(scenario, args.runs, work_dir)
+            ok = seconds <= args.target
+            failed |= not ok
+            print(f"{name}: {seconds:.3f} сек (интерпретатор {baseline:.3f} сек, "
+                  f"цель {args.target:.2f} сек) - {'OK' if ok else 'МЕДЛЕННО'}")
+
+        _, loaded = run_python(['-c', HEAVY_CHECK.format(modules=HEAVY_MODULES)], work_dir)
+        loaded = loaded.strip()
+        if loaded:
+            failed = True
+            print(f"При запуске загружены тяжелые модули: {loaded}")
+        else:
+            print("Тяжелые модули при запуске не загружаются")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
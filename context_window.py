@@ -0,0 +1,171 @@
+"""Скользящий контекст презентации с жестким бюджетом токенов"""
+import math
+import os
+import re
+from collections import deque
+
+# Бюджет токенов на "Что мы уже обсудили" в промпте каждого слайда
+DEFAULT_CONTEXT_TOKENS = int(os.getenv('BRAND_ANALYZER_CONTEXT_TOKENS', '600'))
+# Для русского текста токенизатор gpt-4o дает в среднем около 3 символов на токен
+CHARS_PER_TOKEN = 3
+
+RECENT_COMMENTS = 2
+MAX_ELEMENTS = 40
+MAX_DECISIONS = 20
+MAX_SUMMARIES = 20
+# Длина сжатого описания элемента и краткого пересказа старого комментария
+ELEMENT_CHARS = 160
+SUMMARY_CHARS = 100
+
+
+def count_tokens(text):
+    """Оценка числа токенов текста"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def compact(text, limit):
+    """Обрезает текст до limit символов по границе слова"""
+    text = " ".join(str(text).split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - 1].rsplit(' ', 1)[0]
+    return cut + "…"
+
+
+def normalize_name(name):
+    """Ключ для поиска повторов: "Логотип.", "логотип" и "ЛОГОТИП " - один элемент"""
+    return re.sub(r'[\W_]+', ' ', str(name).lower()).strip()
+
+
+class RollingContext:
+    """Контекст уже обсужденных слайдов постоянного размера.
+
+    Последние комментарии хранятся целиком, более старые заменяются краткими
+    пересказами. Ключевые элементы объединяются по нормализованному имени
+    и ранжируются по числу упоминаний и свежести; при переполнении
+    вытесняются наименее важные. brief() собирает текст для промпта,
+    не превышая бюджет токенов: сначала последние комментарии, затем
+    элементы и решения по рангу, затем пересказы более ранних слайдов.
+    """
+
+    def __init__(self, token_budget=DEFAULT_CONTEXT_TOKENS, recent_comments=RECENT_COMMENTS,
+                 max_elements=MAX_ELEMENTS, max_decisions=MAX_DECISIONS, max_summaries=MAX_SUMMARIES):
+        self.token_budget = token_budget
+        self.recent_comments = recent_comments
+        self.max_elements = max_elements
+        self.max_decisions = max_decisions
+        self.max_summaries = max_summaries
+        self.reset()
+
+    def reset(self):
+        self.comments = deque()
+        self.summaries = deque(maxlen=self.max_summaries)
+        self.elements = {}
+        self.decisions = {}
+        self.slides_seen = 0
+
+    def add_comment(self, slide_number, comment):
+        """Добавляет комментарий; вышедший из окна комментарий становится кратким пересказом"""
+        self.comments.append((slide_number, comment))
+        self.slides_seen += 1
+        while len(self.comments) > self.recent_comments:
+            old_slide, old_comment = self.comments.popleft()
+            self.summaries.append((old_slide, compact(old_comment, SUMMARY_CHARS)))
+
+    def merge(self, slide_number, update_info):
+        """Добавляет ключевые элементы и решения, извлеченные из анализа слайда"""
+        key_elements = update_info.get('key_elements')
+        if not isinstance(key_elements, dict):
+            key_elements = {}
+        for name, description in key_elements.items():
+            key = normalize_name(name)
+            if not key:
+                continue
+            element = self.elements.get(key)
+            if element is None:
+                element = self.elements[key] = {'name': str(name).strip(), 'mentions': 0}
+            element['description'] = compact(description, ELEMENT_CHARS)
+            element['mentions'] += 1
+            element['last_slide'] = slide_number
+        self._evict(self.elements, self.max_elements)
+
+        decisions = update_info.get('design_decisions')
+        if not isinstance(decisions, list):
+            decisions = []
+        for decision in decisions:
+            key = normalize_name(decision)
+            if not key:
+                continue
+            entry = self.decisions.setdefault(key, {'text': compact(decision, ELEMENT_CHARS), 'mentions': 0})
+            entry['mentions'] += 1
+            entry['last_slide'] = slide_number
+        self._evict(self.decisions, self.max_decisions)
+
+    @staticmethod
+    def _rank(entry):
+        return entry['mentions'], entry['last_slide']
+
+    def _evict(self, entries, limit):
+        """Удаляет наименее важные записи сверх лимита"""
+        if len(entries) <= limit:
+            return
+        ranked = sorted(entries, key=lambda key: self._rank(entries[key]))
+        for key in ranked[:len(entries) - limit]:
+            del entries[key]
+
+    def ranked_elements(self):
+        return sorted(self.elements.values(), key=self._rank, reverse=True)
+
+    def ranked_decisions(self):
+        return sorted(self.decisions.values(), key=self._rank, reverse=True)
+
+    def brief(self, token_budget=None):
+        """Текст контекста для промпта, не длиннее бюджета токенов"""
+        if not self.comments:
+            return "Это первый слайд презентации."
+
+        budget = token_budget or self.token_budget
+        used = 0
+
+        def take(lines, header, share=1.0, line_chars=None):
+            """Строки секции, пока они помещаются в долю оставшегося бюджета"""
+            nonlocal used
+            limit = used + (budget - used) * share
+            cost = count_tokens(header)
+            if used + cost > limit:
+                return []
+            taken = [header]
+            for line in lines:
+                if line_chars:
+                    line = compact(line, line_chars)
+                line_cost = count_tokens(line) + 1
+                if used + cost + line_cost > limit:
+                    break
+                taken.append(line)
+                cost += line_cost
+            if len(taken) == 1:
+                return []
+            used += cost
+            return taken
+
+        # Последние комментарии: каждому не больше трети бюджета
+        comment_chars = budget * CHARS_PER_TOKEN // 3
+        recent = take(
+            [f"- {comment}" for _, comment in reversed(self.comments)],
+            "Последние обсуждения:", line_chars=comment_chars
+        )
+        recent = recent[:1] + recent[:0:-1]  # в хронологическом порядке
+
+        elements = take(
+            [f"- {element['name']}: {element['description']}" for element in self.ranked_elements()],
+            "\nКлючевые элементы дизайна:", share=0.7
+        )
+        decisions = take(
+            [f"- {decision['text']}" for decision in self.ranked_decisions()],
+            "\nДизайнерские решения:", share=0.5
+        )
+        earlier = take(
+            [f"- слайд {slide}: {summary}" for slide, summary in reversed(self.summaries)],
+            "\nРанее в презентации:"
+        )
+        return "\n".join(recent + elements + decisions + earlier)
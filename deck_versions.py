@@ -0,0 +1,191 @@
+"""Версии одной презентации: отпечатки страниц, сопоставление с прошлым запуском и отчет об изменениях.
+
+Агентства присылают v2, v3, v4 одного брендбука, где меняется несколько
+страниц. Каждая отрендеренная страница получает отпечаток: SHA-256
+пикселей (точное совпадение) и dHash (похожесть). Страницы новой версии
+сопоставляются со страницами прошлого запуска по отпечатку независимо от
+позиции, поэтому вставки и перестановки не заставляют анализировать
+презентацию заново: повторно анализируются только новые и измененные слайды.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+
+VERSIONS_DIR = os.getenv('BRAND_ANALYZER_VERSIONS_DIR', 'versions')
+# Максимальное расстояние Хэмминга dHash, при котором страница считается измененной версией старой
+CHANGED_DISTANCE = int(os.getenv('BRAND_ANALYZER_CHANGED_DISTANCE', '12'))
+
+# Суффиксы версий в имени файла: "brandbook_v3", "brandbook v2.1", "brandbook-final"
+_VERSION_SUFFIX = re.compile(
+    r'([\s_.-]*(v|ver|version|верс(ия)?|rev)[\s_.-]*\d+([._]\d+)*|[\s_.-]+(final|draft|финал|черновик)|[\s_.-]*\(\d+\))+$',
+    re.IGNORECASE
+)
+
+
+def deck_key(pdf_path):
+    """Имя презентации без версии: brandbook_v2.pdf и Brandbook v3.pdf - одна презентация"""
+    name = os.path.splitext(os.path.basename(pdf_path))[0].strip()
+    base = _VERSION_SUFFIX.sub('', name) or name
+    return re.sub(r'[\W_]+', '_', base.lower()).strip('_') or 'deck'
+
+
+def page_fingerprint(slide):
+    """Отпечаток отрендеренной страницы: {'sha256': точный, 'dhash': перцептивный}.
+
+    Считается по пикселям до release(), пока изображение не прошло через JPEG.
+    """
+    from slide_dedup import dhash
+
+    image = slide.image if slide.image.mode == 'RGB' else slide.image.convert('RGB')
+    digest = hashlib.sha256()
+    digest.update(f"{image.size[0]}x{image.size[1]}".encode())
+    digest.update(image.tobytes())
+    return {'sha256': digest.hexdigest(), 'dhash': dhash(slide)}
+
+
+def match_pages(previous, current, max_distance=CHANGED_DISTANCE):
+    """Сопоставляет страницы новой версии со страницами прошлого запуска.
+
+    previous и current - {номер слайда: отпечаток}. Сначала страницы
+    сопоставляются по точному отпечатку (первое свободное совпадение,
+    так что повторяющиеся страницы тоже расходятся по парам), затем
+    оставшиеся - по ближайшему dHash. Возвращает словарь:
+    unchanged {новый: старый}, changed {новый: старый}, new [новые], removed [старые].
+    """
+    by_digest = {}
+    for number in sorted(previous):
+        by_digest.setdefault(previous[number]['sha256'], []).append(number)
+
+    unchanged = {}
+    for number in sorted(current):
+        candidates = by_digest.get(current[number]['sha256'])
+        if candidates:
+            unchanged[number] = candidates.pop(0)
+
+    matched = set(unchanged.values())
+    free = [number for number in sorted(previous) if number not in matched]
+    changed = {}
+    taken = set()
+    rest = [number for number in sorted(current) if number not in unchanged]
+    if free and rest:
+        import numpy as np
+        from slide_dedup import hamming_distances
+
+        free_hashes = np.array([previous[number]['dhash'] for number in free], dtype=np.uint64)
+        # Пары с наименьшим расстоянием сопоставляются первыми
+        pairs = []
+        for number in rest:
+            distances = hamming_distances(current[number]['dhash'], free_hashes)
+            pairs.extend((int(distance), number, free[index]) for index, distance in enumerate(distances)
+                         if distance <= max_distance)
+        for _, number, old in sorted(pairs):
+            if number not in changed and old not in taken:
+                changed[number] = old
+                taken.add(old)
+
+    return {
+        'unchanged': unchanged,
+        'changed': changed,
+        'new': [number for number in rest if number not in changed],
+        'removed': [number for number in free if number not in taken],
+    }
+
+
+def format_diff(matches, previous_name, current_name):
+    """Текстовый отчет об изменениях между версиями"""
+    moved = {new: old for new, old in matches['unchanged'].items() if new != old}
+    lines = [
+        f"ИЗМЕНЕНИЯ ПРЕЗЕНТАЦИИ: {previous_name} -> {current_name}",
+        f"Дата: {time.strftime('%Y-%m-%d %H:%M:%S')}",
+        "",
+        f"Без изменений: {len(matches['unchanged'])} (из них перемещено: {len(moved)})",
+        f"Изменено: {len(matches['changed'])}",
+        f"Новых: {len(matches['new'])}",
+        f"Удалено: {len(matches['removed'])}",
+    ]
+    if matches['changed']:
+        lines += ["", "Измененные слайды:"]
+        lines += [f"- слайд {new} (был слайд {old})" for new, old in sorted(matches['changed'].items())]
+    if matches['new']:
+        lines += ["", "Новые слайды:"]
+        lines += [f"- слайд {number}" for number in matches['new']]
+    if matches['removed']:
+        lines += ["", "Удаленные слайды (номера прошлой версии):"]
+        lines += [f"- слайд {number}" for number in matches['removed']]
+    if moved:
+        lines += ["", "Перемещенные слайды:"]
+        lines += [f"- слайд {old} -> {new}" for new, old in sorted(moved.items())]
+    return "\n".join(lines) + "\n"
+
+
+class DeckHistory:
+    """Результаты последнего запуска презентации (versions/<ключ>.json).
+
+    Для каждой страницы хранятся отпечаток, статус, анализ и события
+    контекста (comment/merge, как в журнале запуска), по которым
+    восстанавливается presentation_context при повторном использовании.
+    Результаты пригодны для повторного использования, только если
+    совпадают настройки анализа (контекст, режимы).
+    """
+
+    def __init__(self, key, versions_dir=VERSIONS_DIR):
+        self.key = key
+        self.path = os.path.join(versions_dir, f"{key}.json")
+        self.pdf_name = None
+        self.settings = None
+        self.pages = {}
+        self._unclaimed = None
+
+    @classmethod
+    def for_pdf(cls, pdf_path, versions_dir=VERSIONS_DIR):
+        return cls(deck_key(pdf_path), versions_dir).load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.pdf_name = data.get('pdf_name')
+            self.settings = data.get('settings')
+            self.pages = {int(number): page for number, page in data.get('pages', {}).items()}
+        return self
+
+    def usable(self, settings):
+        """Можно ли повторно использовать результаты с такими настройками"""
+        return bool(self.pages) and self.settings == settings
+
+    def claim(self, fingerprint):
+        """Страница прошлого запуска с тем же точным отпечатком (номер, запись) или None.
+
+        Каждая страница выдается один раз и в том же порядке, что и в match_pages,
+        поэтому потоковое решение о повторном использовании совпадает с итоговым отчетом.
+        """
+        if self._unclaimed is None:
+            self._unclaimed = {}
+            for number in sorted(self.pages):
+                self._unclaimed.setdefault(self.pages[number]['fingerprint']['sha256'], []).append(number)
+        candidates = self._unclaimed.get(fingerprint['sha256'])
+        if not candidates:
+            return None
+        number = candidates.pop(0)
+        return number, self.pages[number]
+
+    def fingerprints(self):
+        return {number: page['fingerprint'] for number, page in self.pages.items()}
+
+    def save(self, pdf_name, settings, pages):
+        """Заменяет историю результатами нового запуска {номер: страница}"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'pdf_name': pdf_name,
+                'settings': settings,
+                'time': time.time(),
+                'pages': {str(number): page for number, page in sorted(pages.items())},
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self.pdf_name, self.settings, self.pages = pdf_name, settings, dict(pages)
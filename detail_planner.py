@@ -0,0 +1,159 @@
+"""Выбор разрешения и уровня детализации изображений с оценкой токенов"""
+import math
+import os
+
+import numpy as np
+
+from context_window import count_tokens
+
+# Стоимость изображения в токенах: (базовая, за плитку 512x512) по моделям.
+# Для detail=low берется только базовая стоимость.
+IMAGE_TOKEN_COSTS = {
+    'gpt-4o': (85, 170),
+    'gpt-4o-mini': (2833, 5667),
+}
+
+# Бюджет токенов изображений на одну презентацию (0 - без ограничения)
+DEFAULT_TOKEN_BUDGET = int(os.getenv('BRAND_ANALYZER_TOKEN_BUDGET', '0'))
+
+# Уровни детализации от самого дешевого к самому подробному:
+# (название, detail для API, максимальная сторона изображения)
+DETAIL_LEVELS = [
+    ('low', 'low', 512),
+    ('high-512', 'high', 512),
+    ('high-1024', 'high', 1024),
+    ('high-2000', 'high', 2000),
+]
+
+# Пороги сложности изображения для выбора уровня (доля контурных пикселей)
+COMPLEXITY_THRESHOLDS = [0.02, 0.06, 0.12]
+
+
+def scaled_size(width, height, max_side):
+    """Размер изображения после вписывания в квадрат max_side без увеличения"""
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def count_tiles(width, height):
+    """Количество плиток 512x512 для detail=high по правилам API.
+
+    Изображение вписывается в 2048x2048, затем короткая сторона
+    уменьшается до 768, после чего считаются плитки.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def estimate_image_tokens(width, height, detail, model='gpt-4o-mini'):
+    """Оценка входных токенов изображения"""
+    base, per_tile = IMAGE_TOKEN_COSTS.get(model, IMAGE_TOKEN_COSTS['gpt-4o'])
+    if detail == 'low':
+        return base
+    return base + per_tile * count_tiles(width, height)
+
+
+def message_text_tokens(messages):
+    """Оценка токенов текстовой части сообщений (без изображений)"""
+    parts = []
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        parts.extend(part.get('text', '') for part in content or [] if part.get('type') == 'text')
+    return count_tokens("".join(parts))
+
+
+def visual_complexity(grayscale, sample_side=256):
+    """Доля контурных пикселей на уменьшенной копии изображения (0..1)"""
+    step = max(1, max(grayscale.shape) // sample_side)
+    sample = grayscale[::step, ::step].astype(np.int16)
+    if sample.shape[0] < 2 or sample.shape[1] < 2:
+        return 0.0
+    dx = np.abs(np.diff(sample, axis=1))[:-1, :]
+    dy = np.abs(np.diff(sample, axis=0))[:, :-1]
+    return float(np.mean((dx + dy) > 32))
+
+
+class DetailPlanner:
+    """Планирует разрешение и detail для каждого слайда в рамках бюджета токенов.
+
+    Уровень сначала выбирается по визуальной сложности слайда (простые слайды
+    с логотипом или цветом не нуждаются в мелких плитках), затем при
+    необходимости понижается, чтобы уложиться в оставшийся бюджет колоды.
+    План и оценка сохраняются вместе с фактическими usage.prompt_tokens; с оценкой
+    сравнивается их часть за вычетом текста промпта (actual_image_tokens).
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, model='gpt-4o-mini'):
+        self.token_budget = token_budget
+        self.model = model
+        self.total_slides = 0
+        self.records = {}
+
+    def start_deck(self, total_slides):
+        """Сбрасывает план перед анализом новой презентации"""
+        self.total_slides = total_slides
+        self.records = {}
+
+    @property
+    def estimated_tokens(self):
+        return sum(record['estimated_tokens'] for record in self.records.values())
+
+    @property
+    def actual_tokens(self):
+        return sum(record['actual_prompt_tokens'] or 0 for record in self.records.values())
+
+    @property
+    def actual_image_tokens(self):
+        return sum(record['actual_image_tokens'] or 0 for record in self.records.values())
+
+    def plan(self, slide):
+        """Возвращает план для слайда (повторный вызов отдает тот же план)"""
+        if slide.slide_number in self.records:
+            return self.records[slide.slide_number]
+
+        width, height = slide.size
+        complexity = visual_complexity(slide.grayscale)
+        level_index = sum(complexity > threshold for threshold in COMPLEXITY_THRESHOLDS)
+
+        allowance = None
+        if self.token_budget:
+            remaining_slides = max(1, self.total_slides - len(self.records))
+            allowance = (self.token_budget - self.estimated_tokens) / remaining_slides
+
+        while True:
+            name, detail, max_side = DETAIL_LEVELS[level_index]
+            plan_size = scaled_size(width, height, max_side)
+            tokens = estimate_image_tokens(*plan_size, detail, self.model)
+            if allowance is None or tokens <= allowance or level_index == 0:
+                break
+            level_index -= 1
+
+        record = {
+            'slide': slide.slide_number,
+            'level': name,
+            'detail': detail,
+            'size': plan_size,
+            'complexity': round(complexity, 4),
+            'estimated_tokens': tokens,
+            'actual_prompt_tokens': None,
+            'actual_image_tokens': None,
+        }
+        self.records[slide.slide_number] = record
+        return record
+
+    def record_usage(self, slide_number, usage, text_tokens=0):
+        """Сохраняет фактическое количество входных токенов из response.usage.
+
+        text_tokens - оценка текстовой части промпта (message_text_tokens):
+        остаток prompt_tokens приходится на изображение и сравним с оценкой плана.
+        """
+        if slide_number in self.records and usage is not None:
+            record = self.records[slide_number]
+            record['actual_prompt_tokens'] = usage.prompt_tokens
+            record['actual_image_tokens'] = max(0, usage.prompt_tokens - text_tokens)
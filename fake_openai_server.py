@@ -0,0 +1,245 @@
+"""Локальная замена OpenAI chat.completions для замеров производительности без сети и оплаты.
+
+Сервер принимает POST /v1/chat/completions и отвечает заготовленными
+ответами с настраиваемой задержкой, ошибками сервера и ответами 429.
+Клиент OpenAI подключается к нему через base_url:
+
+    python fake_openai_server.py --port 8765 --latency lognormal:0.8,0.4 --rate-limit-rate 0.05
+    python pdf_brand_analyzer.py deck.pdf --base-url http://127.0.0.1:8765/v1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rate_limiter import estimate_request_tokens
+
+# Ответы по умолчанию. Текстовый ответ повторяет структуру, которую разбирает гайд.
+DEFAULT_REPLIES = {
+    'text': (
+        "• ГЛАВНОЕ: **Логотип** построен на простой геометрии и хорошо читается.\n"
+        "• ДЕТАЛИ: фирменный синий задает спокойный тон, крупная типографика держит иерархию.\n"
+        "• СВЯЗЬ: дальше посмотрим, как этот знак работает на носителях."
+    ),
+    'json_object': {
+        'category': 'элемент системы',
+        'variant_group': None,
+        'key_elements': {'Логотип': 'геометрический знак с фирменным синим'},
+        'design_decisions': ['крупная типографика', 'ограниченная палитра'],
+        'connections': ['логотип повторяется на носителях'],
+    },
+}
+
+
+def parse_latency(spec):
+    """Разбирает описание задержки: "0.5", "fixed:0.5", "uniform:0.2,1.0", "lognormal:0.8,0.4".
+
+    Для lognormal задаются медиана в секундах и сигма логарифма.
+    Возвращает функцию без аргументов, которая выдает задержку в секундах.
+    """
+    kind, _, args = str(spec).partition(':')
+    if not args:
+        kind, args = 'fixed', kind
+    values = [float(value) for value in args.split(',')]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: median * random.lognormvariate(0, sigma)
+    raise ValueError(f"Неизвестное распределение задержки: {kind}")
+
+
+def sample_from_schema(schema):
+    """Минимальный экземпляр JSON по схеме structured outputs"""
+    kind = schema.get('type')
+    if kind == 'object':
+        return {name: sample_from_schema(value) for name, value in schema.get('properties', {}).items()}
+    if kind == 'array':
+        return [sample_from_schema(schema.get('items', {}))]
+    if kind in ('integer', 'number'):
+        return 1
+    if kind == 'boolean':
+        return True
+    return DEFAULT_REPLIES['text'].split('\n')[0].replace('• ГЛАВНОЕ: ', '')
+
+
+def reply_content(request, replies=DEFAULT_REPLIES):
+    """Текст ответа по формату, который запросил клиент"""
+    response_format = request.get('response_format') or {}
+    kind = response_format.get('type')
+    if kind == 'json_schema':
+        return json.dumps(sample_from_schema(response_format['json_schema']['schema']), ensure_ascii=False)
+    if kind == 'json_object':
+        return json.dumps(replies['json_object'], ensure_ascii=False)
+    return replies['text']
+
+
+def make_completion(request, replies=DEFAULT_REPLIES):
+    """Тело ответа chat.completion на запрос (используется и в batch_jobs.LocalBatchTransport)"""
+    content = reply_content(request, replies)
+    prompt_tokens = estimate_request_tokens(dict(request, max_tokens=0))
+    completion_tokens = len(content) // 4
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': request.get('model', 'gpt-4o-mini'),
+        'choices': [{
+            'index': 0,
+            'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': content},
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class FakeOpenAIServer:
+    """HTTP-сервер, имитирующий chat.completions.
+
+    latency         - описание распределения задержки (см. parse_latency);
+    error_rate      - доля ответов 500;
+    rate_limit_rate - доля ответов 429 с заголовком retry-after-ms;
+    replies         - заготовки ответов {'text': str, 'json_object': dict},
+                      для json_schema ответ строится по схеме запроса.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency='0', error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after_ms=500, replies=None,
+                 requests_per_minute=10000, tokens_per_minute=10000000, seed=None):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+        self.replies = dict(DEFAULT_REPLIES, **(replies or {}))
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'ok': 0, 'errors': 0, 'rate_limited': 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Запускает сервер в фоновом потоке"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def completion(self, request):
+        return make_completion(request, self.replies)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body, headers=None):
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('x-ratelimit-limit-requests', str(server.requests_per_minute))
+                self.send_header('x-ratelimit-limit-tokens', str(server.tokens_per_minute))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self.send_json(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'invalid_request_error'}})
+                    return
+                server.count('requests')
+                request = json.loads(body or b'{}')
+
+                time.sleep(max(0.0, server.latency()))
+                roll = server.random.random()
+                if roll < server.rate_limit_rate:
+                    server.count('rate_limited')
+                    self.send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                                   {'retry-after-ms': str(server.retry_after_ms)})
+                    return
+                if roll < server.rate_limit_rate + server.error_rate:
+                    server.count('errors')
+                    self.send_json(500, {'error': {'message': 'Injected server error', 'type': 'server_error'}})
+                    return
+
+                server.count('ok')
+                self.send_json(200, server.completion(request))
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальная замена OpenAI chat.completions")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='0.5',
+                        help='задержка ответа: "0.5", "uniform:0.2,1.0" или "lognormal:медиана,сигма"')
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument('--retry-after-ms', type=int, default=500, help="retry-after-ms в ответах 429")
+    parser.add_argument('--replies', default=None, help="JSON-файл с заготовками ответов (text, json_object)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    replies = None
+    if args.replies:
+        with open(args.replies, encoding='utf-8') as f:
+            replies = json.load(f)
+
+    server = FakeOpenAIServer(
+        host=args.host, port=args.port, latency=args.latency, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after_ms=args.retry_after_ms,
+        replies=replies, seed=args.seed
+    )
+    print(f"Сервер запущен: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Статистика запросов: {server.stats}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,109 @@
+"""Предварительный разбор PDF утилитами poppler до рендеринга.
+
+pdfinfo дает число и размеры страниц, pdftotext - длину текстового слоя
+каждой страницы, pdfimages -list - число встроенных изображений. По ним
+еще до рендеринга отбираются кандидаты в текстовые страницы (много текста
+и ни одного растрового изображения). Векторная графика здесь не видна,
+поэтому кандидат пропускается без рендеринга только после пиксельной
+проверки превью (BrandAnalyzer.scan_deck).
+"""
+import hashlib
+import os
+import subprocess
+
+# Страница без изображений и с текстовым слоем не короче этого числа символов - текстовая
+TEXT_ONLY_CHARS = int(os.getenv('BRAND_ANALYZER_TEXT_ONLY_CHARS', '800'))
+PREFLIGHT_TIMEOUT = 120
+
+# Типы строк pdfimages -list, которые считаются изображениями (smask - альфа-канал другого изображения)
+IMAGE_TYPES = ('image', 'stencil')
+
+
+def run_tool(name, args, poppler_path=None, timeout=PREFLIGHT_TIMEOUT):
+    """Запускает утилиту poppler и возвращает ее вывод"""
+    command = [os.path.join(poppler_path, name) if poppler_path else name] + list(args)
+    result = subprocess.run(command, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"{name} завершился с кодом {result.returncode}: "
+                           f"{result.stderr.decode('utf-8', 'ignore').strip()}")
+    return result.stdout.decode('utf-8', 'ignore')
+
+
+def split_pages_text(text, first_page, last_page):
+    """Текст страниц из вывода pdftotext (страницы разделены символом \\f)"""
+    parts = text.split('\f')
+    return {page: parts[index] if index < len(parts) else ''
+            for index, page in enumerate(range(first_page, last_page + 1))}
+
+
+def parse_image_list(text):
+    """Число изображений по страницам из вывода pdfimages -list"""
+    counts = {}
+    for line in text.splitlines()[2:]:  # заголовок и разделитель
+        fields = line.split()
+        if len(fields) < 3 or not fields[0].isdigit():
+            continue
+        if fields[2] in IMAGE_TYPES:
+            page = int(fields[0])
+            counts[page] = counts.get(page, 0) + 1
+    return counts
+
+
+def text_length(text):
+    """Длина текста без пробельных символов"""
+    return sum(1 for char in text if not char.isspace())
+
+
+class Preflight:
+    """Результат предварительного разбора PDF.
+
+    pages - {номер: {'size', 'text_chars', 'images', 'kind', 'text_digest'}},
+    kind - 'text' (кандидат в текстовые по текстовому слою) или 'visual'.
+    """
+
+    def __init__(self, page_count, pages):
+        self.page_count = page_count
+        self.pages = pages
+
+    @property
+    def text_pages(self):
+        return {number for number, page in self.pages.items() if page['kind'] == 'text'}
+
+    @property
+    def visual_pages(self):
+        return sorted(number for number, page in self.pages.items() if page['kind'] == 'visual')
+
+    def summary(self):
+        return (
+            f"{self.page_count} стр.: визуальных {len(self.visual_pages)}, "
+            f"текстовых по текстовому слою {len(self.text_pages)}"
+        )
+
+
+def run_preflight(pdf_path, first_page=1, last_page=None, text_only_chars=TEXT_ONLY_CHARS, poppler_path=None):
+    """Разбирает PDF утилитами pdfinfo, pdftotext и pdfimages"""
+    from slide_render import get_page_count, get_page_sizes
+
+    page_count = get_page_count(pdf_path)
+    last_page = min(last_page or page_count, page_count)
+    sizes = get_page_sizes(pdf_path, first_page, last_page)
+    range_args = ['-f', str(first_page), '-l', str(last_page)]
+    texts = split_pages_text(
+        run_tool('pdftotext', range_args + ['-enc', 'UTF-8', pdf_path, '-'], poppler_path),
+        first_page, last_page
+    )
+    images = parse_image_list(run_tool('pdfimages', range_args + ['-list', pdf_path], poppler_path))
+
+    pages = {}
+    for number in range(first_page, last_page + 1):
+        text = texts.get(number, '')
+        chars = text_length(text)
+        count = images.get(number, 0)
+        pages[number] = {
+            'size': sizes.get(number),
+            'text_chars': chars,
+            'images': count,
+            'kind': 'text' if count == 0 and chars >= text_only_chars else 'visual',
+            'text_digest': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+        }
+    return Preflight(page_count, pages)
@@ -0,0 +1,128 @@
+"""Презентационный гайд в PDF, который собирается по мере анализа слайдов"""
+import io
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Image, Table, TableStyle
+
+# Маркеры структуры рассказа и их подписи в гайде
+SECTION_MARKERS = (
+    ('• ГЛАВНОЕ:', '🎯 Ключевой момент:', 'MainPoint', '<b>{}</b>'),
+    ('• ДЕТАЛИ:', '💡 Акценты:', 'Details', '<b>{}</b>'),
+    ('• СВЯЗЬ:', 'Переход:', 'Details', '<i>{}</i>'),
+)
+
+
+def guide_styles():
+    """Стили гайда"""
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(
+        name='SlideNumber',
+        fontSize=14,
+        textColor=colors.HexColor('#1a237e'),
+        spaceAfter=12
+    ))
+    styles.add(ParagraphStyle(
+        name='MainPoint',
+        fontSize=12,
+        textColor=colors.HexColor('#000000'),
+        spaceAfter=6,
+        leading=14
+    ))
+    styles.add(ParagraphStyle(
+        name='Details',
+        fontSize=10,
+        textColor=colors.HexColor('#424242'),
+        spaceAfter=6,
+        leading=12
+    ))
+    styles.add(ParagraphStyle(
+        name='Swatch',
+        fontSize=7,
+        leading=8,
+        alignment=1
+    ))
+    return styles
+
+
+def palette_table(features, styles):
+    """Образцы основных цветов слайда с долей площади и пустое пространство"""
+    palette = features.get('palette') or []
+    if not palette:
+        return None
+    swatches = ['' for _ in palette]
+    labels = [Paragraph(f"{item['color']}<br/>{item['coverage']:.0%}", styles['Swatch']) for item in palette]
+    table = Table([swatches, labels], colWidths=[0.8*inch] * len(palette), rowHeights=[0.3*inch, None], hAlign='LEFT')
+    table.setStyle(TableStyle(
+        [('BACKGROUND', (column, 0), (column, 0), colors.HexColor(item['color']))
+         for column, item in enumerate(palette)]
+        + [('BOX', (0, 0), (-1, 0), 0.5, colors.HexColor('#9e9e9e'))]
+    ))
+    return table
+
+
+class GuideBuilder:
+    """Гайд, который пополняется по одному слайду.
+
+    add_slide() сразу готовит элементы страницы (номер, миниатюру, разобранный
+    рассказ) и хранит их по номеру слайда, поэтому порядок завершения слайдов
+    не важен, а build() после последнего слайда только верстает PDF.
+    Миниатюра передается готовыми JPEG-байтами (SlideImage.thumbnail),
+    признаки слайда (slide_features) - словарем с палитрой и пустым пространством.
+    """
+
+    def __init__(self, guide_path, title):
+        self.guide_path = guide_path
+        self.title = title
+        self.styles = guide_styles()
+        self.slides = {}
+
+    def add_slide(self, slide_number, analysis, thumbnail=None, features=None):
+        """Добавляет (или заменяет) страницу слайда"""
+        story = [Paragraph(f"Слайд {slide_number}", self.styles['SlideNumber'])]
+
+        if thumbnail:
+            story.append(Image(io.BytesIO(thumbnail), width=2*inch, height=1.5*inch, kind='proportional'))
+            story.append(Spacer(1, 10))
+
+        if features:
+            table = palette_table(features, self.styles)
+            if table is not None:
+                story.append(table)
+            story.append(Paragraph(f"Пустое пространство: {features['whitespace']:.0%}", self.styles['Details']))
+            story.append(Spacer(1, 6))
+
+        # Разбираем и форматируем анализ
+        for part in analysis.split('\n'):
+            for marker, label, style, markup in SECTION_MARKERS:
+                if part.startswith(marker):
+                    text = escape(label + part[len(marker):])
+                    story.append(Paragraph(markup.format(text), self.styles[style]))
+                    break
+            else:
+                if part.strip() and not part.startswith('-'):
+                    story.append(Paragraph(escape(part), self.styles['Details']))
+
+        story.append(Spacer(1, 20))
+        self.slides[slide_number] = story
+
+    def build(self):
+        """Верстает PDF из подготовленных страниц в порядке номеров слайдов"""
+        doc = SimpleDocTemplate(
+            self.guide_path,
+            pagesize=A4,
+            rightMargin=72,
+            leftMargin=72,
+            topMargin=72,
+            bottomMargin=72
+        )
+
+        story = [Paragraph(escape(self.title), self.styles['Title']), Spacer(1, 20)]
+        for slide_number in sorted(self.slides):
+            story.extend(self.slides[slide_number])
+
+        doc.build(story)
+        return self.guide_path
@@ -0,0 +1,203 @@
+"""Адаптивное ограничение частоты запросов к API: token bucket, Retry-After и backoff"""
+import asyncio
+import os
+import random
+import re
+import time
+
+DEFAULT_RPM = int(os.getenv('BRAND_ANALYZER_RPM', '500'))
+DEFAULT_TPM = int(os.getenv('BRAND_ANALYZER_TPM', '200000'))
+DEFAULT_MAX_RETRIES = int(os.getenv('BRAND_ANALYZER_MAX_RETRIES', '5'))
+
+# Оценка токенов изображения без декодирования: detail=low и detail=high (6 плиток)
+LOW_DETAIL_IMAGE_TOKENS = 85
+HIGH_DETAIL_IMAGE_TOKENS = 85 + 170 * 6
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(value):
+    """Разбирает длительность из заголовков API ("1s", "6m0s", "20ms") в секунды"""
+    if value is None:
+        return None
+    parts = _DURATION_PART.findall(str(value))
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after_seconds(headers):
+    """Задержка из заголовков retry-after-ms / retry-after (None, если их нет)"""
+    if headers is None:
+        return None
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            return None
+    return None
+
+
+def estimate_request_tokens(request_params):
+    """Грубая оценка токенов запроса для лимита TPM: текст, изображения и max_tokens"""
+    chars = 0
+    images = 0
+    for message in request_params.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get('type') == 'text':
+                chars += len(part.get('text', ''))
+            elif part.get('type') == 'image_url':
+                detail = part.get('image_url', {}).get('detail', 'auto')
+                images += LOW_DETAIL_IMAGE_TOKENS if detail == 'low' else HIGH_DETAIL_IMAGE_TOKENS
+    return chars // 4 + images + request_params.get('max_tokens', 0)
+
+
+class TokenBucket:
+    """Ведро токенов с пополнением capacity единиц в минуту"""
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        rate = self.capacity / 60
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Сколько секунд ждать, пока в ведре наберется amount"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.capacity / 60)
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+    def set_capacity(self, capacity_per_minute, remaining=None):
+        """Обновляет лимит и остаток по данным заголовков API"""
+        self.capacity = float(capacity_per_minute)
+        if remaining is not None:
+            self.tokens = min(self.tokens, float(remaining))
+
+
+class RateLimiter:
+    """Общий ограничитель запросов для всех параллельных вызовов одного движка API.
+
+    Следит за запросами и токенами в минуту (RPM/TPM), подстраивает лимиты
+    под заголовки x-ratelimit-* из ответов, при 429 приостанавливает все
+    запросы на время из Retry-After, а повторы делает с экспоненциальной
+    задержкой и случайным разбросом (full jitter). Используется из event loop
+    движка, ожидание не блокирует другие корутины.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_RPM, tokens_per_minute=DEFAULT_TPM,
+                 base_backoff=1.0, max_backoff=60.0):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.paused_until = 0.0
+        self._lock = None
+
+        # Статистика
+        self.requests = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self.working_seconds = 0.0
+
+    async def acquire(self, tokens):
+        """Ждет, пока лимиты RPM/TPM и пауза после 429 позволят отправить запрос"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.monotonic()
+        # Под блокировкой ожидающие получают разрешения по очереди (FIFO)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self.paused_until - now,
+                    self.request_bucket.wait_time(1, now),
+                    self.token_bucket.wait_time(tokens, now)
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+        self.throttled_seconds += time.monotonic() - started
+
+    def record_request(self, seconds):
+        """Учитывает время, потраченное на сам запрос"""
+        self.requests += 1
+        self.working_seconds += seconds
+
+    def adjust_tokens(self, estimated, actual):
+        """Поправляет ведро TPM на разницу между оценкой и фактом из usage"""
+        self.token_bucket.consume(actual - estimated)
+
+    def update_from_headers(self, headers):
+        """Подстраивает лимиты под заголовки x-ratelimit-* ответа"""
+        if headers is None:
+            return
+        for bucket, kind in ((self.request_bucket, 'requests'), (self.token_bucket, 'tokens')):
+            limit = headers.get(f'x-ratelimit-limit-{kind}')
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            try:
+                if limit is not None:
+                    bucket.set_capacity(float(limit), float(remaining) if remaining is not None else None)
+            except ValueError:
+                continue
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Задержка перед повтором: Retry-After, если он есть, иначе экспонента с jitter"""
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after)
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def on_rate_limited(self, headers, attempt):
+        """Реакция на 429: пауза для всех запросов движка, возвращает задержку повтора"""
+        self.rate_limited += 1
+        retry_after = retry_after_seconds(headers)
+        if retry_after is None and headers is not None:
+            retry_after = parse_duration(headers.get('x-ratelimit-reset-requests'))
+        delay = self.backoff_delay(attempt, retry_after)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+    async def sleep_before_retry(self, delay):
+        self.retries += 1
+        self.backoff_seconds += delay
+        await asyncio.sleep(delay)
+
+    def stats(self):
+        """Время в ожидании лимитов и повторов относительно времени работы запросов"""
+        return {
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'retries': self.retries,
+            'throttled_seconds': round(self.throttled_seconds, 3),
+            'backoff_seconds': round(self.backoff_seconds, 3),
+            'working_seconds': round(self.working_seconds, 3),
+            'requests_per_minute_limit': self.request_bucket.capacity,
+            'tokens_per_minute_limit': self.token_bucket.capacity,
+        }
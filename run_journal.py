@@ -0,0 +1,151 @@
+"""Журнал запуска анализа для возобновления после сбоя или закрытия приложения"""
+import hashlib
+import json
+import os
+import time
+
+JOURNAL_ENABLED = os.getenv('BRAND_ANALYZER_JOURNAL', '1') != '0'
+DEFAULT_JOURNAL_DIR = os.getenv('BRAND_ANALYZER_JOURNAL_DIR', 'journals')
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 содержимого файла (читается блоками)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_key(pdf_path, context, settings):
+    """Ключ запуска: содержимое PDF, контекст анализа и настройки, влияющие на результат"""
+    payload = json.dumps({
+        'pdf': file_digest(pdf_path),
+        'context': context,
+        'settings': settings,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def open_run_journal(pdf_path, context, settings, journal_dir=DEFAULT_JOURNAL_DIR):
+    """Открывает журнал запуска по настройкам окружения (None, если журнал выключен)"""
+    if not JOURNAL_ENABLED:
+        return None
+    if not os.path.exists(journal_dir):
+        os.makedirs(journal_dir, exist_ok=True)
+    key = run_key(pdf_path, context, settings)
+    return RunJournal(os.path.join(journal_dir, f"{key[:32]}.jsonl"))
+
+
+class RunJournal:
+    """Журнал одного запуска в формате JSONL, запись только дозаписью.
+
+    События:
+    - start: начало запуска (количество слайдов);
+    - slide: слайд завершен (статус, анализ, признак текстового слайда);
+    - comment / merge: изменения presentation_context в порядке их применения;
+    - resume: запуск продолжен после сбоя;
+    - complete: запуск завершен, при следующем запуске журнал начинается заново.
+
+    Каждое событие сбрасывается на диск сразу, поэтому после сбоя теряется
+    не больше одного слайда, а контекст восстанавливается повтором событий.
+    События контекста слайда, для которого нет записи slide, при загрузке
+    отбрасываются: такой слайд анализируется заново и запишет их повторно.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.total_slides = None
+        self.completed = False
+        self.slides = {}
+        self.context_events = []
+        self._file = None
+
+    def load(self):
+        """Читает журнал предыдущего запуска. Оборванная последняя строка игнорируется."""
+        self.total_slides = None
+        self.completed = False
+        self.slides = {}
+        self.context_events = []
+        if not os.path.exists(self.path):
+            return self
+
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                kind = event.get('type')
+                if kind == 'start':
+                    self.total_slides = event['total_slides']
+                elif kind == 'slide':
+                    self.slides[event['slide']] = event
+                elif kind in ('comment', 'merge'):
+                    self.context_events.append(event)
+                elif kind == 'resume':
+                    # События незавершенных до сбоя слайдов повторятся при их новом анализе
+                    self.context_events = self.finished_events()
+                elif kind == 'complete':
+                    self.completed = True
+        self.context_events = self.finished_events()
+        return self
+
+    def finished_events(self):
+        """События контекста только завершенных слайдов, в исходном порядке"""
+        return [event for event in self.context_events if event['slide'] in self.slides]
+
+    def can_resume(self, total_slides):
+        """Есть ли незавершенный запуск той же презентации"""
+        return bool(self.slides) and not self.completed and self.total_slides == total_slides
+
+    def first_unfinished(self, total_slides):
+        """Номер первого слайда без записи о завершении"""
+        for slide_number in range(1, total_slides + 1):
+            if slide_number not in self.slides:
+                return slide_number
+        return None
+
+    def start(self, total_slides, resume):
+        """Открывает журнал на дозапись; без resume начинает его заново"""
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        if not resume:
+            self.slides = {}
+            self.context_events = []
+            self.record({'type': 'start', 'total_slides': total_slides, 'time': time.time()})
+        else:
+            self.record({'type': 'resume', 'time': time.time()})
+        self.total_slides = total_slides
+
+    def record(self, event):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record_slide(self, slide_number, status, analysis=None, is_text=False):
+        event = {
+            'type': 'slide',
+            'slide': slide_number,
+            'status': status,
+            'analysis': analysis,
+            'is_text': is_text,
+        }
+        self.slides[slide_number] = event
+        self.record(event)
+
+    def record_comment(self, slide_number, comment):
+        self.record({'type': 'comment', 'slide': slide_number, 'comment': comment})
+
+    def record_merge(self, slide_number, analysis, update_info):
+        self.record({'type': 'merge', 'slide': slide_number, 'analysis': analysis, 'update_info': update_info})
+
+    def complete(self):
+        self.record({'type': 'complete', 'time': time.time()})
+        self.completed = True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
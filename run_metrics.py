@@ -0,0 +1,220 @@
+"""Метрики запуска анализа: интервалы этапов, запросы к API и токены.
+
+Результаты выгружаются в JSON и в текстовый формат Prometheus.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv('BRAND_ANALYZER_METRICS', '1') != '0'
+DEFAULT_METRICS_DIR = os.getenv('BRAND_ANALYZER_METRICS_DIR', 'metrics')
+
+# Этапы конвейера в порядке отчета
+PIPELINE_STAGES = ('preflight', 'render', 'resize', 'classify', 'encode', 'analyze', 'report', 'guide')
+
+# Границы корзин гистограммы задержек запросов к API (секунды)
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+class RunMetrics:
+    """Интервалы (spans) этапов конвейера и записи о запросах к API.
+
+    Время этапа в summary() исключающее: если внутри analyze выполняется
+    encode, время encode не входит в analyze, поэтому сумма этапов не
+    превышает общего времени работы. В самих интервалах хранится полная
+    длительность. Запросы к API записываются из потока движка API,
+    поэтому все изменения идут под блокировкой.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает метрики перед новым запуском"""
+        with self._lock:
+            self.started = time.time()
+            self._origin = time.perf_counter()
+            self.seconds = defaultdict(float)
+            self.counts = defaultdict(int)
+            self.spans = []
+            self.api_calls = []
+            self.context_tokens = {}
+            self.slides_done = 0
+
+    @contextmanager
+    def stage(self, name, slide=None, **attrs):
+        """Интервал этапа. Возвращает словарь интервала, в него можно дописать атрибуты."""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        span = {'name': name, 'slide': slide, 'start': time.perf_counter() - self._origin}
+        span.update(attrs)
+        # Второй элемент - время вложенных этапов, которое нужно вычесть
+        frame = [time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield span
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            if stack:
+                stack[-1][1] += elapsed
+            span['start'] = round(span['start'], 6)
+            span['duration'] = round(elapsed, 6)
+            with self._lock:
+                self.seconds[name] += elapsed - frame[1]
+                self.counts[name] += 1
+                self.spans.append(span)
+
+    def record_api_call(self, call):
+        """Запись о запросе к API (см. AsyncApiEngine): задержка, повторы, токены"""
+        call = dict(call)
+        if 'start' in call:
+            call['start'] -= self._origin
+        for key in ('start', 'queue_seconds', 'latency_seconds'):
+            if key in call:
+                call[key] = round(call[key], 6)
+        with self._lock:
+            self.api_calls.append(call)
+
+    def record_context_tokens(self, slide_number, tokens):
+        """Сколько токенов контекста презентации ушло в промпт слайда"""
+        with self._lock:
+            self.context_tokens[slide_number] = tokens
+
+    def slide_finished(self):
+        with self._lock:
+            self.slides_done += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self._origin
+
+    def throughput(self):
+        """Слайдов в секунду с начала запуска"""
+        elapsed = self.elapsed()
+        return self.slides_done / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """{этап: секунды} в порядке PIPELINE_STAGES, затем прочие этапы"""
+        names = [name for name in PIPELINE_STAGES if name in self.seconds]
+        names += sorted(name for name in self.seconds if name not in PIPELINE_STAGES)
+        return {name: round(self.seconds[name], 3) for name in names}
+
+    def token_totals(self):
+        totals = {'prompt': 0, 'completion': 0, 'cached': 0}
+        for call in self.api_calls:
+            for kind in totals:
+                totals[kind] += call.get(f'{kind}_tokens') or 0
+        return totals
+
+    def api_summary(self):
+        """Сводка по запросам к API: исходы, повторы, задержки по типам запросов"""
+        outcomes = defaultdict(int)
+        by_label = defaultdict(lambda: {'count': 0, 'latency_seconds': 0.0})
+        retries = 0
+        for call in self.api_calls:
+            outcomes[call['outcome']] += 1
+            retries += call.get('retries', 0)
+            label = by_label[call.get('label') or 'other']
+            label['count'] += 1
+            label['latency_seconds'] += call.get('latency_seconds', 0.0)
+        return {
+            'requests': len(self.api_calls),
+            'outcomes': dict(outcomes),
+            'retries': retries,
+            'by_label': {
+                name: {'count': value['count'], 'latency_seconds': round(value['latency_seconds'], 3)}
+                for name, value in by_label.items()
+            },
+            'tokens': self.token_totals(),
+        }
+
+    def to_dict(self, **info):
+        """Все метрики запуска одним словарем для выгрузки в JSON"""
+        with self._lock:
+            return {
+                'info': info,
+                'started': self.started,
+                'elapsed_seconds': round(self.elapsed(), 3),
+                'slides_done': self.slides_done,
+                'slides_per_second': round(self.throughput(), 4),
+                'stages': self.summary(),
+                'stage_counts': dict(self.counts),
+                'api': self.api_summary(),
+                'context_tokens': dict(self.context_tokens),
+                'spans': list(self.spans),
+                'api_calls': list(self.api_calls),
+            }
+
+    def to_prometheus(self, **labels):
+        """Метрики в текстовом формате Prometheus (exposition format 0.0.4)"""
+        base = ",".join(f'{key}="{_escape_label(value)}"' for key, value in sorted(labels.items()))
+
+        def series(name, value, **extra):
+            parts = [base] if base else []
+            parts += [f'{key}="{_escape_label(item)}"' for key, item in extra.items()]
+            return f"{name}{{{','.join(parts)}}} {value}" if parts else f"{name} {value}"
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self._lock:
+            stages = self.summary()
+            metric('brand_analyzer_stage_seconds_total', 'counter', "Time spent per pipeline stage",
+                   [series('brand_analyzer_stage_seconds_total', seconds, stage=name) for name, seconds in stages.items()])
+            metric('brand_analyzer_stage_runs_total', 'counter', "Number of spans per pipeline stage",
+                   [series('brand_analyzer_stage_runs_total', self.counts[name], stage=name) for name in stages])
+            metric('brand_analyzer_slides_total', 'counter', "Slides finished in this run",
+                   [series('brand_analyzer_slides_total', self.slides_done)])
+            metric('brand_analyzer_run_seconds', 'gauge', "Wall time of the run",
+                   [series('brand_analyzer_run_seconds', round(self.elapsed(), 3))])
+
+            api = self.api_summary()
+            metric('brand_analyzer_api_requests_total', 'counter', "API requests by outcome",
+                   [series('brand_analyzer_api_requests_total', count, outcome=outcome)
+                    for outcome, count in sorted(api['outcomes'].items())])
+            metric('brand_analyzer_api_retries_total', 'counter', "API retries after 429, 5xx or connection errors",
+                   [series('brand_analyzer_api_retries_total', api['retries'])])
+            metric('brand_analyzer_tokens_total', 'counter', "Tokens reported in response.usage",
+                   [series('brand_analyzer_tokens_total', count, kind=kind) for kind, count in api['tokens'].items()])
+            context_tokens = list(self.context_tokens.values())
+            metric('brand_analyzer_context_tokens', 'summary', "Presentation context tokens per slide prompt",
+                   [series('brand_analyzer_context_tokens_sum', sum(context_tokens)),
+                    series('brand_analyzer_context_tokens_count', len(context_tokens))])
+
+            latencies = [call['latency_seconds'] for call in self.api_calls if call['outcome'] != 'cached']
+            buckets = [
+                series('brand_analyzer_api_latency_seconds_bucket', sum(1 for value in latencies if value <= bound),
+                       le=bound)
+                for bound in LATENCY_BUCKETS
+            ]
+            buckets.append(series('brand_analyzer_api_latency_seconds_bucket', len(latencies), le='+Inf'))
+            buckets.append(series('brand_analyzer_api_latency_seconds_sum', round(sum(latencies), 6)))
+            buckets.append(series('brand_analyzer_api_latency_seconds_count', len(latencies)))
+            metric('brand_analyzer_api_latency_seconds', 'histogram', "API request latency including retries", buckets)
+        return "\n".join(lines) + "\n"
+
+    def save(self, name, metrics_dir=DEFAULT_METRICS_DIR, **info):
+        """Сохраняет метрики в metrics_dir: name.json и name.prom. Возвращает пути."""
+        if not os.path.exists(metrics_dir):
+            os.makedirs(metrics_dir, exist_ok=True)
+        json_path = os.path.join(metrics_dir, f"{name}.json")
+        prom_path = os.path.join(metrics_dir, f"{name}.prom")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(**info), f, ensure_ascii=False, indent=2)
+        with open(prom_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus(**{key: value for key, value in info.items() if isinstance(value, str)}))
+        return json_path, prom_path
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,144 @@
+"""Векторизованная классификация текстовых слайдов по всей презентации"""
+import numpy as np
+from PIL import Image as PILImage
+
+# Сторона уменьшенной копии слайда, на которой идет классификация
+CLASSIFIER_SIDE = 128
+# Сторона превью страницы для проверки до рендеринга: на нем штрихи текста
+# еще не сливаются в серый фон, и доля чернил совпадает с полным размером
+PREVIEW_CHECK_SIDE = 1200
+# Доля "чернильных" пикселей, начиная с которой слайд считается текстовым
+TEXT_RATIO_THRESHOLD = 0.15
+# Порог контраста с фоном: для белого фона максимум - прежнее правило "< 128",
+# а минимум близок к нему, чтобы пастельные заливки и светлые фигуры не считались чернилами
+MAX_INK_CONTRAST = 127
+MIN_INK_CONTRAST = 96
+# Текст - тонкие штрихи: не больше этой доли чернил лежит внутри сплошных областей
+MAX_SOLID_SHARE = 0.3
+
+
+def downsample_image(image, side=CLASSIFIER_SIDE):
+    """Равномерная выборка side x side пикселей изображения в оттенках серого, массив (side, side).
+
+    Выборка без сглаживания: сглаживание превращает штрихи текста в серый
+    цвет, близкий к фону, а доля чернил по выборке не смещена относительно
+    полного размера.
+    """
+    image = image.resize((side, side), PILImage.NEAREST)
+    return np.asarray(image.convert('L'))
+
+
+def downsample(slide, side=CLASSIFIER_SIDE):
+    """Уменьшенная копия слайда в оттенках серого, массив (side, side)"""
+    return downsample_image(slide.image, side)
+
+
+def ink_stats(stack, contrast):
+    """Доля "чернильных" пикселей и доля сплошных чернил для каждого изображения пачки (N, side, side).
+
+    Фон каждого изображения - самое частое значение яркости (один bincount
+    со смещением по номеру изображения), чернила - пиксели, отличающиеся
+    от фона больше чем на contrast. Сплошные чернила - те, у которых все
+    соседи 3x3 тоже чернила: штрихи текста в выборке тоньше, заливки и фигуры - нет.
+    """
+    count, height, width = stack.shape
+    offsets = np.arange(count, dtype=np.int64)[:, None] * 256
+    flat = stack.reshape(count, -1).astype(np.int64)
+    per_image = np.bincount((flat + offsets).ravel(), minlength=count * 256).reshape(count, 256)
+    background = per_image.argmax(axis=1)
+    ink = (np.abs(flat - background[:, None]) > contrast).reshape(count, height, width)
+
+    # Эрозия квадратом 3x3, раздельно по строкам и столбцам
+    solid = ink.copy()
+    solid[:, 1:, :] &= ink[:, :-1, :]
+    solid[:, :-1, :] &= ink[:, 1:, :]
+    rows = solid.copy()
+    solid[:, :, 1:] &= rows[:, :, :-1]
+    solid[:, :, :-1] &= rows[:, :, 1:]
+
+    ink_pixels = ink.sum(axis=(1, 2))
+    ratios = ink_pixels / (height * width)
+    solid_shares = solid.sum(axis=(1, 2)) / np.maximum(ink_pixels, 1)
+    return ratios, solid_shares
+
+
+class TextSlideClassifier:
+    """Определяет текстовые слайды одной пакетной операцией NumPy.
+
+    Фон каждого слайда берется как мода его гистограммы, а порог контраста
+    "чернил" с фоном - из гистограммы всей презентации в пределах
+    MIN_INK_CONTRAST..MAX_INK_CONTRAST. Порог фиксируется вызовом prime() до
+    первого решения (по превью всех страниц), поэтому решение о слайде не
+    зависит от порядка обработки, а темные брендбуки не пропускаются целиком.
+    Без prime() презентацией считается первая классифицируемая пачка.
+
+    Текстовый слайд - чернил больше TEXT_RATIO_THRESHOLD (как в прежнем
+    правиле) и чернила в основном тонкие штрихи, а не сплошные заливки:
+    образцы цветов, крупные фигуры и фотографии текстовыми не считаются.
+    Результат запоминается для каждого слайда, повторные вызовы (например,
+    на попытках запроса) бесплатны.
+    """
+
+    def __init__(self, side=CLASSIFIER_SIDE, ratio_threshold=TEXT_RATIO_THRESHOLD):
+        self.side = side
+        self.ratio_threshold = ratio_threshold
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает статистику перед новой презентацией"""
+        self.histogram = np.zeros(256, dtype=np.int64)
+        self.contrast = None
+        self.results = {}
+        self.ratios = {}
+        self.solid_shares = {}
+
+    def ink_contrast(self):
+        """Порог контраста с фоном по гистограмме презентации"""
+        cdf = np.cumsum(self.histogram)
+        total = cdf[-1]
+        if not total:
+            return MAX_INK_CONTRAST
+        low = np.searchsorted(cdf, total * 0.01)
+        high = np.searchsorted(cdf, total * 0.99)
+        return int(min(MAX_INK_CONTRAST, max(MIN_INK_CONTRAST, (high - low) / 2)))
+
+    def prime(self, images):
+        """Фиксирует порог контраста по изображениям всей презентации (PIL, любого размера).
+
+        Без изображений порог - прежнее правило для светлого фона.
+        """
+        images = list(images)
+        self.histogram = np.zeros(256, dtype=np.int64)
+        if images:
+            stack = np.stack([downsample_image(image, self.side) for image in images])
+            self.histogram += np.bincount(stack.ravel(), minlength=256)
+        self.contrast = self.ink_contrast()
+        return self.contrast
+
+    def classify_images(self, images):
+        """Флаги "текстовый" для изображений (например, превью) без запоминания"""
+        if self.contrast is None:
+            self.prime(images)
+        stack = np.stack([downsample_image(image, self.side) for image in images])
+        return [self.decide(ratio, solid) for ratio, solid in zip(*ink_stats(stack, self.contrast))]
+
+    def decide(self, ratio, solid_share):
+        return bool(ratio > self.ratio_threshold and solid_share <= MAX_SOLID_SHARE)
+
+    def classify_batch(self, slides):
+        """Классифицирует список слайдов, возвращает список флагов "текстовый" """
+        pending = [slide for slide in slides if slide.slide_number not in self.results]
+        if pending:
+            stack = np.stack([downsample(slide, self.side) for slide in pending])
+            if self.contrast is None:
+                self.histogram += np.bincount(stack.ravel(), minlength=256)
+                self.contrast = self.ink_contrast()
+            for slide, ratio, solid in zip(pending, *ink_stats(stack, self.contrast)):
+                self.ratios[slide.slide_number] = float(ratio)
+                self.solid_shares[slide.slide_number] = float(solid)
+                self.results[slide.slide_number] = self.decide(ratio, solid)
+
+        return [self.results[slide.slide_number] for slide in slides]
+
+    def is_text(self, slide):
+        return self.classify_batch([slide])[0]
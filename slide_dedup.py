@@ -0,0 +1,86 @@
+"""Поиск почти одинаковых слайдов по перцептивному хешу (dHash)"""
+import os
+
+import numpy as np
+from PIL import Image as PILImage
+
+# Максимальное расстояние Хэмминга между хешами, при котором слайды считаются вариантами
+DEFAULT_DEDUP_DISTANCE = int(os.getenv('BRAND_ANALYZER_DEDUP_DISTANCE', '5'))
+
+HASH_SIZE = 8
+
+
+def dhash(slide, hash_size=HASH_SIZE):
+    """Разностный хеш слайда: 64 бита сравнения соседних пикселей по строкам"""
+    image = slide.image.convert('L').resize((hash_size + 1, hash_size), PILImage.BILINEAR, reducing_gap=2.0)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming_distances(value, hashes):
+    """Расстояния Хэмминга от хеша value до массива хешей (uint64)"""
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class DuplicateIndex:
+    """Индекс групп почти одинаковых слайдов.
+
+    Первый слайд группы - лидер, он анализируется полностью. Следующие
+    слайды, чей хеш отличается от хеша лидера не больше чем на max_distance
+    бит, попадают в его группу.
+    """
+
+    def __init__(self, max_distance=DEFAULT_DEDUP_DISTANCE):
+        self.max_distance = max_distance
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает индекс перед новой презентацией"""
+        self.leaders = []
+        self.leader_hashes = np.zeros(0, dtype=np.uint64)
+        self.groups = {}
+        self.hashes = {}
+        self.calls_saved = 0
+
+    def match(self, slide):
+        """Возвращает номер лидера группы для варианта или None для нового слайда.
+
+        Новый слайд сразу становится лидером своей группы.
+        """
+        value = dhash(slide)
+        self.hashes[slide.slide_number] = value
+        if self.leaders:
+            distances = hamming_distances(value, self.leader_hashes)
+            best = int(distances.argmin())
+            if distances[best] <= self.max_distance:
+                leader = self.leaders[best]
+                self.groups[leader].append(slide.slide_number)
+                return leader
+        self.add_leader(slide.slide_number, value)
+        return None
+
+    def add_leader(self, slide_number, value=None):
+        """Регистрирует слайд как лидера новой группы"""
+        if value is None:
+            value = self.hashes[slide_number]
+        self.leaders.append(slide_number)
+        self.leader_hashes = np.append(self.leader_hashes, np.uint64(value))
+        self.groups[slide_number] = [slide_number]
+
+    def duplicate_groups(self):
+        """Группы, в которых есть хотя бы один вариант: {лидер: [слайды группы]}"""
+        return {leader: members for leader, members in self.groups.items() if len(members) > 1}
+
+    def summary(self):
+        """Текстовый отчет о группах похожих слайдов и сэкономленных запросах"""
+        groups = self.duplicate_groups()
+        if not groups:
+            return ""
+        lines = ["ПОХОЖИЕ СЛАЙДЫ:"]
+        for leader, members in groups.items():
+            variants = ", ".join(str(number) for number in members[1:])
+            lines.append(f"- Слайд {leader}: варианты {variants}")
+        lines.append(f"Сэкономлено запросов к API: {self.calls_saved}")
+        return "\n".join(lines)
@@ -0,0 +1,123 @@
+"""Локальные признаки слайда по пикселям: палитра, пустое пространство и сетка заполненности"""
+import numpy as np
+from PIL import Image as PILImage
+
+# Сторона уменьшенной копии слайда, на которой считаются признаки
+FEATURE_SIDE = 96
+# Бит на канал при квантовании цвета (3 бита - 512 корзин цвета)
+COLOR_BITS = 3
+# Сколько основных цветов возвращать и минимальная доля площади цвета
+PALETTE_SIZE = 5
+MIN_COVERAGE = 0.02
+# Максимальное отличие от фона по каналу, при котором пиксель считается пустым
+BACKGROUND_TOLERANCE = 24
+# Размер грубой сетки расположения элементов
+GRID_SIZE = 3
+
+
+def downsample_rgb(slide, side=FEATURE_SIDE):
+    """Равномерная выборка side x side пикселей слайда в RGB, массив (side, side, 3).
+
+    Берутся исходные пиксели без сглаживания: доли площади по такой выборке
+    не смещены, в палитру не попадают смешанные цвета на границах, а
+    выборка на порядки быстрее сглаживающего уменьшения.
+    """
+    image = slide.image.resize((side, side), PILImage.NEAREST)
+    return np.asarray(image.convert('RGB'))
+
+
+def extract_features(stack, palette_size=PALETTE_SIZE, grid_size=GRID_SIZE):
+    """Признаки для пачки слайдов, stack - массив (N, side, side, 3) uint8.
+
+    Все вычисления идут одним проходом по пачке: гистограммы цветов всех
+    слайдов считаются одним bincount со смещением по номеру слайда.
+    """
+    count, height, width, _ = stack.shape
+    pixels = stack.reshape(count, -1, 3).astype(np.int64)
+    area = pixels.shape[1]
+
+    # Квантованный цвет каждого пикселя -> номер корзины
+    shift = 8 - COLOR_BITS
+    levels = 1 << COLOR_BITS
+    quantized = pixels >> shift
+    bins = (quantized[..., 0] * levels + quantized[..., 1]) * levels + quantized[..., 2]
+    bin_count = levels ** 3
+    offset_bins = (bins + np.arange(count)[:, None] * bin_count).ravel()
+    counts = np.bincount(offset_bins, minlength=count * bin_count).reshape(count, bin_count)
+    # Средний исходный цвет каждой корзины (точнее, чем центр корзины)
+    sums = np.stack([
+        np.bincount(offset_bins, weights=pixels[..., channel].ravel(), minlength=count * bin_count)
+        for channel in range(3)
+    ], axis=-1).reshape(count, bin_count, 3)
+    means = sums / np.maximum(counts, 1)[..., None]
+
+    top = np.argsort(-counts, axis=1)[:, :palette_size]
+    top_counts = np.take_along_axis(counts, top, axis=1)
+    top_colors = np.take_along_axis(means, top[..., None], axis=1).round().astype(int)
+
+    # Фон - самый частый цвет; пустое пространство - пиксели, близкие к фону
+    background = top_colors[:, 0]
+    empty = (np.abs(pixels - background[:, None, :]) <= BACKGROUND_TOLERANCE).all(axis=2)
+    whitespace = empty.mean(axis=1)
+
+    # Доля заполненных (не фоновых) пикселей в ячейках сетки grid_size x grid_size
+    filled = ~empty.reshape(count, height, width)
+    rows = np.array_split(np.arange(height), grid_size)
+    cols = np.array_split(np.arange(width), grid_size)
+    grid = np.stack([
+        np.stack([filled[:, row[0]:row[-1] + 1, col[0]:col[-1] + 1].mean(axis=(1, 2)) for col in cols], axis=1)
+        for row in rows
+    ], axis=1)
+
+    results = []
+    for index in range(count):
+        palette = [
+            {'color': '#{:02x}{:02x}{:02x}'.format(*top_colors[index, rank]),
+             'coverage': round(float(top_counts[index, rank]) / area, 3)}
+            for rank in range(top.shape[1])
+            if top_counts[index, rank] / area >= MIN_COVERAGE
+        ]
+        results.append({
+            'palette': palette,
+            'whitespace': round(float(whitespace[index]), 3),
+            'grid': np.round(grid[index], 2).tolist(),
+        })
+    return results
+
+
+def format_hints(features):
+    """Компактная строка признаков для промпта"""
+    palette = ", ".join(f"{item['color']} {item['coverage']:.0%}" for item in features['palette'])
+    grid = " / ".join(" ".join(f"{value:.0%}" for value in row) for row in features['grid'])
+    return (
+        f"палитра (доля площади): {palette}; пустое пространство: {features['whitespace']:.0%}; "
+        f"заполненность сетки {len(features['grid'])}x{len(features['grid'])} по строкам: {grid}"
+    )
+
+
+class SlideFeatureExtractor:
+    """Признаки слайдов с запоминанием по номеру слайда.
+
+    extract_batch() обрабатывает всю презентацию одной операцией NumPy,
+    extract() - один слайд при потоковом анализе. Считать признаки нужно
+    до release(), пока пиксели слайда в памяти.
+    """
+
+    def __init__(self, side=FEATURE_SIDE):
+        self.side = side
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает результаты перед новой презентацией"""
+        self.results = {}
+
+    def extract_batch(self, slides):
+        pending = [slide for slide in slides if slide.slide_number not in self.results]
+        if pending:
+            stack = np.stack([downsample_rgb(slide, self.side) for slide in pending])
+            for slide, features in zip(pending, extract_features(stack)):
+                self.results[slide.slide_number] = features
+        return [self.results[slide.slide_number] for slide in slides]
+
+    def extract(self, slide):
+        return self.extract_batch([slide])[0]
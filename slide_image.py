@@ -0,0 +1,126 @@
+"""Представление слайда в памяти: пиксели, JPEG и base64 без записи на диск"""
+import base64
+import io
+from functools import cached_property
+
+import numpy as np
+from PIL import Image as PILImage
+
+# Максимальные размеры изображения согласно документации API
+MAX_IMAGE_SIZE = (2000, 2000)
+# Максимальный размер файла изображения для API (20MB)
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+# Размер миниатюры для презентационного гайда
+THUMBNAIL_SIZE = (200, 200)
+
+
+class SlideImage:
+    """Слайд в памяти.
+
+    Пиксели, JPEG-байты и base64-строка вычисляются лениво и по одному разу.
+    После анализа release() освобождает все тяжелые представления, ничего
+    не кодируя заранее: дальше слайд нужен только гайду, которому хватает
+    миниатюры (thumbnail). Она создается один раз при рендеринге и не освобождается.
+    """
+
+    def __init__(self, slide_number, image=None, jpeg_bytes=None, quality=95):
+        if image is None and jpeg_bytes is None:
+            raise ValueError("Нужно передать изображение или JPEG-байты")
+        self.slide_number = slide_number
+        self.quality = quality
+        self.thumbnail = None
+        self.released = False
+        if image is not None:
+            self.__dict__['image'] = image
+        if jpeg_bytes is not None:
+            self.__dict__['jpeg_bytes'] = jpeg_bytes
+
+    @classmethod
+    def from_render(cls, slide_number, image, max_size=MAX_IMAGE_SIZE, thumbnail_size=None):
+        """Создает слайд из отрендеренной страницы, приводя ее к размерам API.
+
+        С thumbnail_size сразу создается JPEG-миниатюра для гайда.
+        """
+        width, height = image.size
+        # Обычно страница уже отрендерена в нужном размере (slide_render.RenderPolicy),
+        # уменьшение здесь - страховка для изображений из других источников
+        if width > max_size[0] or height > max_size[1]:
+            image.thumbnail(max_size, PILImage.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        slide = cls(slide_number, image=image)
+        if thumbnail_size:
+            slide.make_thumbnail(thumbnail_size)
+        return slide
+
+    def make_thumbnail(self, size=THUMBNAIL_SIZE):
+        """JPEG-байты миниатюры, вписанной в size"""
+        image = self.image.copy()
+        image.thumbnail(size, PILImage.LANCZOS, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        self.thumbnail = buffer.getvalue()
+        return self.thumbnail
+
+    @cached_property
+    def image(self):
+        """Декодированное PIL-изображение"""
+        if self.released:
+            raise ValueError(f"Слайд {self.slide_number} уже освобожден (release)")
+        image = PILImage.open(io.BytesIO(self.jpeg_bytes))
+        image.load()
+        return image
+
+    @cached_property
+    def jpeg_bytes(self):
+        """JPEG-представление слайда"""
+        data = self._encode_jpeg(self.quality)
+        if len(data) > MAX_IMAGE_BYTES:
+            # Уменьшаем качество, чтобы уложиться в лимит API
+            data = self._encode_jpeg(85)
+        return data
+
+    @cached_property
+    def base64(self):
+        """JPEG в base64 для передачи в API"""
+        return base64.b64encode(self.jpeg_bytes).decode('utf-8')
+
+    @property
+    def data_url(self):
+        return f"data:image/jpeg;base64,{self.base64}"
+
+    @cached_property
+    def pixels(self):
+        """Декодированные RGB-пиксели, массив (высота, ширина, 3)"""
+        return np.asarray(self.image.convert('RGB'))
+
+    @cached_property
+    def grayscale(self):
+        """Пиксели в оттенках серого, массив (высота, ширина)"""
+        return np.asarray(self.image.convert('L'))
+
+    @property
+    def size(self):
+        return self.image.size
+
+    def scaled(self, max_side):
+        """Копия слайда, вписанная в квадрат max_side (кешируется по размеру)"""
+        if max(self.size) <= max_side:
+            return self
+        variants = self.__dict__.setdefault('_variants', {})
+        if max_side not in variants:
+            image = self.image.copy()
+            image.thumbnail((max_side, max_side), PILImage.LANCZOS)
+            variants[max_side] = SlideImage(self.slide_number, image=image, quality=self.quality)
+        return variants[max_side]
+
+    def _encode_jpeg(self, quality):
+        buffer = io.BytesIO()
+        self.image.save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue()
+
+    def release(self):
+        """Освобождает пиксели, JPEG и base64; остается только миниатюра"""
+        self.released = True
+        for name in ('image', 'jpeg_bytes', 'pixels', 'grayscale', 'base64', '_variants'):
+            self.__dict__.pop(name, None)
@@ -0,0 +1,220 @@
+"""Растеризация PDF-презентаций в изображения слайдов"""
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+# Сколько страниц poppler рендерит за один вызов. Пиковое потребление памяти
+# определяется этим окном, а не длиной презентации.
+DEFAULT_RENDER_WINDOW = int(os.getenv('BRAND_ANALYZER_RENDER_WINDOW', '4'))
+
+# Количество процессов рендеринга (1 - рендерим в текущем процессе)
+DEFAULT_RENDER_WORKERS = int(os.getenv('BRAND_ANALYZER_RENDER_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Длинная сторона отрендеренной страницы: больше API не принимает
+# (самый подробный уровень detail_planner - 2000 пикселей)
+DEFAULT_RENDER_MAX_SIDE = int(os.getenv('BRAND_ANALYZER_RENDER_MAX_SIDE', '2000'))
+# Предел разрешения для маленьких страниц (как у pdf2image по умолчанию)
+DEFAULT_RENDER_MAX_DPI = int(os.getenv('BRAND_ANALYZER_RENDER_MAX_DPI', '200'))
+
+# Длинная сторона превью, по которым вся презентация просматривается до основного рендеринга
+PREVIEW_SIDE = 64
+
+POINTS_PER_INCH = 72
+_PAGE_SIZE_KEY = re.compile(r'Page\s+(\d+) size')
+_PAGE_SIZE_VALUE = re.compile(r'([\d.]+) x ([\d.]+)')
+
+
+def get_page_count(pdf_path):
+    """Возвращает количество страниц PDF без рендеринга"""
+    info = pdfinfo_from_path(pdf_path)
+    return int(info['Pages'])
+
+
+def get_page_sizes(pdf_path, first_page=1, last_page=None):
+    """Размеры страниц в пунктах по media box: {номер страницы: (ширина, высота)}"""
+    info = pdfinfo_from_path(pdf_path, first_page=first_page, last_page=last_page or first_page)
+    sizes = {}
+    for key, value in info.items():
+        page = _PAGE_SIZE_KEY.fullmatch(key)
+        size = _PAGE_SIZE_VALUE.match(str(value))
+        if page and size:
+            sizes[int(page.group(1))] = (float(size.group(1)), float(size.group(2)))
+    return sizes
+
+
+def render_previews(pdf_path, first_page=1, last_page=None, side=PREVIEW_SIDE, **convert_kwargs):
+    """Превью страниц в оттенках серого одним вызовом poppler: {номер страницы: PIL-изображение}.
+
+    На превью со стороной в десятки пикселей poppler тратит миллисекунды на
+    страницу, поэтому их можно получить для всей презентации до анализа.
+    """
+    if last_page is None:
+        last_page = get_page_count(pdf_path)
+    images = convert_from_path(pdf_path, first_page=first_page, last_page=last_page,
+                               size=side, grayscale=True, **convert_kwargs)
+    return dict(zip(range(first_page, last_page + 1), images))
+
+
+class RenderPolicy:
+    """Размер рендеринга каждой страницы по ее media box.
+
+    Poppler сразу рендерит страницу так, чтобы длинная сторона была не больше
+    max_side пикселей (-scale-to), вместо рендеринга в полном разрешении
+    с последующим уменьшением. Маленькие страницы не увеличиваются сверх
+    max_dpi, поэтому для них результат такой же, как раньше.
+    """
+
+    def __init__(self, max_side=DEFAULT_RENDER_MAX_SIDE, max_dpi=DEFAULT_RENDER_MAX_DPI):
+        self.max_side = max(1, int(max_side))
+        self.max_dpi = max(1, int(max_dpi))
+
+    def target_side(self, width_pt, height_pt):
+        """Длинная сторона страницы в пикселях после рендеринга"""
+        full_side = max(width_pt, height_pt) * self.max_dpi / POINTS_PER_INCH
+        return max(1, min(self.max_side, round(full_side)))
+
+    def plan(self, pdf_path, first_page, last_page):
+        """{номер страницы: длинная сторона}; пустой словарь, если размеры не удалось узнать"""
+        try:
+            sizes = get_page_sizes(pdf_path, first_page, last_page)
+        except Exception:
+            return {}
+        return {page: self.target_side(*size) for page, size in sizes.items()}
+
+
+def _pages_to_render(first_page, last_page, skip=None):
+    """Номера страниц диапазона без пропускаемых (skip)"""
+    skip = skip or ()
+    return [page for page in range(first_page, last_page + 1) if page not in skip]
+
+
+def _iter_windows(pages, window_size):
+    """Разбивает список страниц на окна не больше window_size страниц"""
+    window_size = max(1, int(window_size))
+    for start in range(0, len(pages), window_size):
+        yield pages[start:start + window_size]
+
+
+def _size_runs(pages, sizes):
+    """Группы подряд идущих страниц с одинаковым размером: (first, last, size).
+
+    Пропущенная страница разрывает группу: poppler рендерит только диапазоны.
+    """
+    runs = []
+    for page in pages:
+        size = sizes.get(page)
+        if runs and runs[-1][1] == page - 1 and runs[-1][2] == size:
+            runs[-1][1] = page
+        else:
+            runs.append([page, page, size])
+    return runs
+
+
+def _render_window(pdf_path, pages, convert_kwargs, sizes=None):
+    """Рендерит одно окно страниц сразу в целевом размере. Выполняется в процессе пула."""
+    started = time.time()
+    images = []
+    for start, end, size in _size_runs(pages, sizes or {}):
+        kwargs = dict(convert_kwargs, size=size) if size else convert_kwargs
+        images.extend(convert_from_path(pdf_path, first_page=start, last_page=end, **kwargs))
+    return images, (started, time.time())
+
+
+def _busy_seconds(intervals):
+    """Суммарное время, когда шел хотя бы один рендер (объединение интервалов)"""
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+class PageRenderer:
+    """Рендерит страницы PDF пулом процессов и отдает их строго по порядку слайдов.
+
+    Диапазон страниц режется на окна, окна раздаются процессам пула. В работе
+    одновременно не больше prefetch окон, так что память остается ограниченной,
+    даже если анализ слайдов идет медленнее рендеринга.
+    """
+
+    def __init__(self, workers=DEFAULT_RENDER_WORKERS, window_size=DEFAULT_RENDER_WINDOW,
+                 prefetch=None, policy=None, **convert_kwargs):
+        self.workers = max(1, int(workers))
+        self.policy = policy or RenderPolicy()
+        self.window_size = max(1, int(window_size))
+        self.prefetch = prefetch or self.workers * 2
+        self.convert_kwargs = convert_kwargs
+        self.pages_rendered = 0
+        self.render_seconds = 0.0
+
+    @property
+    def pages_per_second(self):
+        """Пропускная способность рендеринга, страниц в секунду"""
+        if not self.render_seconds:
+            return 0.0
+        return self.pages_rendered / self.render_seconds
+
+    def iter_pages(self, pdf_path, first_page=1, last_page=None, skip=None):
+        """Отдает пары (номер страницы, PIL-изображение) в порядке страниц.
+
+        Страницы из skip (например, текстовые по данным pdf_preflight) не рендерятся.
+        """
+        if last_page is None:
+            last_page = get_page_count(pdf_path)
+
+        self.pages_rendered = 0
+        self.render_seconds = 0.0
+        sizes = self.policy.plan(pdf_path, first_page, last_page)
+        intervals = []
+        windows = _iter_windows(_pages_to_render(first_page, last_page, skip), self.window_size)
+
+        if self.workers == 1:
+            for window in windows:
+                images, interval = _render_window(pdf_path, window, self.convert_kwargs, sizes)
+                intervals.append(interval)
+                yield from self._deliver(window, images, intervals)
+            return
+
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        try:
+            for window in windows:
+                pending.append((window, executor.submit(
+                    _render_window, pdf_path, window, self.convert_kwargs,
+                    {page: sizes[page] for page in window if page in sizes}
+                )))
+                if len(pending) >= self.prefetch:
+                    window, future = pending.popleft()
+                    images, interval = future.result()
+                    intervals.append(interval)
+                    yield from self._deliver(window, images, intervals)
+
+            while pending:
+                window, future = pending.popleft()
+                images, interval = future.result()
+                intervals.append(interval)
+                yield from self._deliver(window, images, intervals)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def previews(self, pdf_path, first_page=1, last_page=None, side=PREVIEW_SIDE):
+        """Превью страниц (см. render_previews) с настройками poppler этого рендерера"""
+        return render_previews(pdf_path, first_page, last_page, side, **self.convert_kwargs)
+
+    def _deliver(self, window, images, intervals):
+        """Отдает страницы окна, обновляя статистику рендеринга"""
+        self.render_seconds = _busy_seconds(intervals)
+        for page_number in window:
+            self.pages_rendered += 1
+            yield page_number, images.pop(0)
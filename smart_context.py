@@ -0,0 +1,101 @@
+"""Иерархическое (map-reduce) построение контекста дизайн-системы.
+
+Первичный анализ слайдов (map) сжимается в краткие записи, записи
+группируются в порции ограниченного размера, каждая порция обобщается
+отдельным запросом (reduce), и так уровень за уровнем, пока все не
+поместится в один финальный запрос. Размер каждого промпта ограничен,
+поэтому число запросов растет линейно с числом слайдов, а число уровней
+(и время при параллельных запросах) - логарифмически.
+"""
+import json
+import os
+
+from context_window import CHARS_PER_TOKEN, compact, count_tokens
+
+# Бюджет данных в одном reduce-промпте, токенов
+DEFAULT_REDUCE_INPUT_TOKENS = int(os.getenv('BRAND_ANALYZER_REDUCE_INPUT_TOKENS', '3000'))
+# Сколько записей обобщает один запрос (ширина дерева)
+DEFAULT_REDUCE_FAN_IN = int(os.getenv('BRAND_ANALYZER_REDUCE_FAN_IN', '8'))
+# max_tokens промежуточного обобщения и финального отчета
+REDUCE_OUTPUT_TOKENS = 600
+FINAL_OUTPUT_TOKENS = 1000
+# Длина краткой записи первичного анализа одного слайда
+SLIDE_DIGEST_CHARS = 600
+
+REPORT_STRUCTURE = """1. Основные дизайн-системы
+        2. Группы вариантов дизайна
+        3. Ключевые принципы и паттерны
+        4. Связи между элементами"""
+
+REDUCE_PROMPT = """Ниже - сводки по части слайдов презентации. Обобщите их в один JSON-отчет со структурой:
+        """ + REPORT_STRUCTURE + """
+        Сохраните номера слайдов для групп вариантов, пишите кратко: отчет будет объединен с другими частями.
+
+        Данные для анализа: {analysis}"""
+
+FINAL_PROMPT = """Проанализируйте предоставленные данные и создайте JSON-отчет со следующей структурой:
+        """ + REPORT_STRUCTURE + """
+
+        Данные для анализа: {analysis}"""
+
+
+def _as_text(data):
+    return data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+
+
+def slide_digest(slide_number, analysis):
+    """Краткая запись первичного анализа слайда: (первый слайд, последний слайд, текст)"""
+    return slide_number, slide_number, f"Слайд {slide_number}: {compact(_as_text(analysis), SLIDE_DIGEST_CHARS)}"
+
+
+def part_digest(chunk, summary, input_tokens=DEFAULT_REDUCE_INPUT_TOKENS):
+    """Краткая запись обобщения порции. Без summary (запрос не удался) - сжатые исходные записи.
+
+    Запись не длиннее половины бюджета порции, поэтому на следующем уровне
+    в порцию попадают хотя бы две записи и число частей всегда уменьшается.
+    """
+    first, last = chunk[0][0], chunk[-1][1]
+    if summary is None:
+        summary = " ".join(text for _, _, text in chunk)
+    limit = min(REDUCE_OUTPUT_TOKENS, input_tokens // 2 - 1) * CHARS_PER_TOKEN
+    return first, last, compact(f"Слайды {first}-{last}: {_as_text(summary)}", max(1, limit))
+
+
+def chunk_items(items, input_tokens=DEFAULT_REDUCE_INPUT_TOKENS, fan_in=DEFAULT_REDUCE_FAN_IN):
+    """Делит записи на порции подряд: не больше fan_in записей и input_tokens токенов.
+
+    Запись, которая одна превышает бюджет, обрезается до него.
+    """
+    fan_in = max(2, fan_in)
+    item_chars = input_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    used = 0
+    for first, last, text in items:
+        if count_tokens(text) > input_tokens:
+            text = compact(text, item_chars)
+        item = (first, last, text)
+        cost = count_tokens(text) + 1
+        if current and (len(current) >= fan_in or used + cost > input_tokens):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def reduce_messages(chunk, final=False):
+    """Сообщения запроса, обобщающего одну порцию записей"""
+    prompt = FINAL_PROMPT if final else REDUCE_PROMPT
+    return [
+        {
+            "role": "system",
+            "content": prompt.format(analysis="\n".join(text for _, _, text in chunk))
+        },
+        {
+            "role": "user",
+            "content": "Создайте структурированный JSON-отчет на основе этих данных."
+        }
+    ]